@@ -2,10 +2,25 @@ import os
 from pathlib import Path
 from datetime import datetime
 import re
-from sqs2atom import sqs2atoms
-from atom2sro import SRO
-from collections import defaultdict
-import json
+import numpy as np
+from ase.data import atomic_numbers
+from sqs2atom import sqs2atoms, read_bestsqs, bestsqs_to_atoms, write_poscar
+from sqs_cache import SROCache
+from sro_data import ResultsWriter
+from instrumentation import Instrumentation, StageTimer, NULL_TIMER
+from atom2sro import SRO, SiteNeighbors, ensemble_sro_tables, sro_table_to_dict, find_shell_cutoffs
+from atom2sro import local_sro, local_sro_histograms, local_histograms_to_dict
+import sys
+import time
+import hashlib
+import argparse
+from collections import OrderedDict
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+# snapshot files written by mcsqs
+DEFAULT_PATTERN = "bestsqs-*.out"
+BESTSQS_NAME = re.compile(r"^bestsqs-\d+\.out$")
 
 class SQS_Analyzer:
     def __init__(self,
@@ -13,37 +28,246 @@ class SQS_Analyzer:
                  unit_cell_lattice_constant,
                  cutoffs,
                  weights,
-                 write_poscar=True
+                 write_poscar=False,
+                 shared_lattice=False,
+                 workers=1,
+                 chunksize=None,
+                 cache=False,
+                 local_sro=False,
+                 local_bins=40,
+                 instrumentation=None,
+                 pattern=DEFAULT_PATTERN,
+                 n_shells=2,
+                 batch_size=64
                  ):
         self.folder=folder
         self.scale=unit_cell_lattice_constant
+        # None to take them from the coordination shells of the first snapshot
         self.cutoffs=cutoffs
         self.weights=weights
+        self.n_shells=n_shells
         self.write_poscar=write_poscar
+        # compute the neighbor list once for all snapshots on the same sites
+        self.shared_lattice=shared_lattice
+        # number of processes used for the per-file analysis
+        self.workers=workers
+        self.chunksize=chunksize
+        # True for <folder>/.sro_cache.json, or the path of the cache file
+        self.cache=cache
+        self._sro_cache=None
+        # add per-atom SRO histograms ("local_sros") to every record
+        self.local_sro=local_sro
+        self.local_bins=local_bins
+        # optional instrumentation.Instrumentation collecting stage timings and progress
+        self.instrumentation=instrumentation
+        # glob of the snapshot files; the last number in the name is the sqs_id
+        # (only bestsqs-N.out names for the default pattern)
+        self.pattern=pattern
+        # snapshots evaluated together by the shared-lattice bincount
+        self.batch_size=batch_size
+        self.new_files=[]
         self.all_data=[]
     
-    
-    def calculate_all_sros(self):
-        
-        pattern = re.compile(r"^bestsqs-\d+\.out$")
-        files = Path(self.folder).iterdir()
-        
+    def find_files(self):
+        files = [file for file in Path(self.folder).glob(self.pattern) if file.is_file() and sqs_id(file) is not None]
+        if self.pattern == DEFAULT_PATTERN:
+            # skip copies such as bestsqs-3-old.out, which would repeat an sqs_id
+            files = [file for file in files if BESTSQS_NAME.match(file.name)]
+        return sorted(files, key=sqs_id)
+
+    def file_record(self, file):
+        creation_time = os.path.getmtime(file)
+        creation_time_human = datetime.fromtimestamp(creation_time).strftime('%Y-%m-%d %H:%M:%S')
+        # Add filename and its timestamp to the dictionary
+        file_dict = {}
+        file_dict["name"]=file.name
+        file_dict["sqs_id"]=sqs_id(file)
+        file_dict["time"] = creation_time
+        file_dict["time_human"]=creation_time_human
+        return file_dict
+
+    def resolve_shells(self, files, confirm=False, cache=None):
+        """
+        Fills in cutoffs and weights left as None from the first usable snapshot:
+        missing cutoffs are placed halfway between its coordination shells and
+        missing weights are the coordination numbers of the shells. A snapshot is
+        only used once another readable one has the same site count and cell, so an
+        empty or half-written file cannot fix the shells. If no two snapshots agree,
+        the one with the most sites is used, unless confirm is set (watch mode,
+        where the files may still be being written). The shells found are kept
+        in the folder cache, by lattice, and reused from there.
+        """
+        if self.cutoffs is not None and self.weights is not None:
+            return
+        candidates = []
         for file in files:
-            file_dict = {}
-            if file.is_file() and pattern.match(file.name):  # Check if the filename matches the pattern
-                creation_time = os.path.getmtime(file)
-                creation_time_human = datetime.fromtimestamp(creation_time).strftime('%Y-%m-%d %H:%M:%S')
-                # Add filename and its timestamp to the dictionary
-                file_dict["name"]=file.name
-                file_dict["sqs_id"]=int(file.name.split(".")[0].split("-")[-1])
-                file_dict["time"] = creation_time
-                file_dict["time_human"]=creation_time_human
-                atoms_dict,sro_data=self.calculate_sros(file)
+            try:
+                basis_vectors, lattice_vectors, atomic_positions, atomic_species = read_bestsqs(file)
+                atoms = bestsqs_to_atoms(lattice_vectors, atomic_positions, atomic_species, self.scale, sort=False)
+            except Exception:
+                continue
+            for candidate in candidates:
+                if same_lattice(candidate[1], atoms) and self.use_shells(*candidate, cache):
+                    return
+            if len(candidates) < 8:
+                candidates.append((file, atoms))
+        if candidates and not confirm:
+            # a truncated file has fewer sites than a finished one
+            self.use_shells(*max(candidates, key=lambda candidate: len(candidate[1])), cache)
+
+    def use_shells(self, file, atoms, cache=None):
+        """Sets the missing cutoffs and weights from the shells of atoms; False if they cannot be found."""
+        n_shells = self.n_shells if self.weights is None else len(self.weights)
+        key = lattice_key(atoms, [n_shells] if self.cutoffs is None else [0] + sorted(self.cutoffs))
+        shells = cache.shells.get(key) if cache is not None else None
+        if shells is None:
+            try:
+                if self.cutoffs is None:
+                    shells = shared_shell_cutoffs(atoms, n_shells)
+                else:
+                    shells = sorted(self.cutoffs), shared_site_neighbors(atoms, sorted(self.cutoffs)).coordination()
+            except Exception as e:
+                print(f"{file.name}: no shells found ({type(e).__name__}: {e})")
+                return False
+            if cache is not None:
+                cache.store_shells(key, list(shells))
+        cutoffs, coordination = shells
+        self.cutoffs = cutoffs
+        self.weights = self.weights if self.weights is not None else coordination
+        print(f"{file.name}: shell cutoffs {self.cutoffs}, weights {self.weights}")
+        return True
+
+    def open_cache(self):
+        path = Path(self.folder) / ".sro_cache.json" if self.cache is True else self.cache
+        return SROCache(path, root=self.folder)
+
+    def cache_params(self):
+        return dict(scale=self.scale, cutoffs=sorted(self.cutoffs),
+                    weights=[w for _, w in sorted(zip(self.cutoffs, self.weights))],
+                    local_bins=self.local_bins if self.local_sro else None)
+
+    def calculate_all_sros(self, outputs=None, only_if_changed=False):
+        """
+        Analyzes every snapshot of the folder, reusing cached results. Without
+        outputs the records are collected in all_data. Given output paths, every
+        record is streamed to disk (see sro_data.ResultsWriter) and stored in the
+        cache as soon as its snapshot is analyzed, and all_data stays empty, so
+        memory does not grow with the number of snapshots and an interrupted run
+        keeps what it finished. The outputs are replaced atomically at the end;
+        with only_if_changed, only if new snapshots were analyzed or they do not
+        exist yet, and an idle pass does not touch them at all.
+        """
+        files = self.find_files()
+        self.all_data = []
+        self.new_files = []
+        if self.cache and self._sro_cache is None:
+            self._sro_cache = self.open_cache()
+        cache = self._sro_cache if self.cache else None
+        # a watched folder may hold a single, still growing snapshot
+        self.resolve_shells(files, confirm=only_if_changed, cache=cache)
+        if self.cutoffs is None or self.weights is None:
+            # no usable snapshot to find the shells in yet
+            return
+        if cache is not None and cache.key is None:
+            cache.select(self.cache_params())
+        if isinstance(outputs, (str, Path)):
+            outputs = [outputs]
+
+        # only which files are cached; their results are read back one at a time
+        cached = set()
+        if cache is not None:
+            for file in files:
+                if cache.hit(file):
+                    cached.add(file)
+                    if self.write_poscar:
+                        # the analysis is cached, the POSCAR may not have been asked for then
+                        self.write_cached_poscar(file)
+        new_files = [file for file in files if file not in cached]
+        removed = cache is not None and len(cache.entries) > len(cached)
+        if only_if_changed and not new_files and not removed:
+            outputs = [output for output in outputs or [] if not Path(output).exists()]
+            if not outputs:
+                # an idle watch poll: nothing to analyze or write
+                if cache is not None:
+                    cache.save()
+                return
+        if self.instrumentation is not None and new_files:
+            self.instrumentation.start(len(new_files))
+
+        writers = [ResultsWriter(output) for output in outputs or []]
+        try:
+            new_results = self.iter_new_results(new_files)
+            for file in files:
+                if file in cached:
+                    result = cache.load(file)
+                else:
+                    # analyzed in file order, as they are needed
+                    file, result = next(new_results)
+                if result is None:
+                    continue
+                file_dict = self.file_record(file)
                 #file_dict["atoms"]=atoms_dict
-                file_dict["sros"]=sro_data
-                self.all_data.append(file_dict)
-                print(file.name)
-                print(creation_time_human)
+                file_dict.update(result)
+                if file not in cached:
+                    self.new_files.append(file)
+                    print(file.name)
+                    print(file_dict["time_human"])
+                    if cache is not None:
+                        cache.store(file, result)
+                for writer in writers:
+                    writer.write(file_dict)
+                if outputs is None:
+                    self.all_data.append(file_dict)
+        except BaseException:
+            # the part files and the cache results file keep what was done so far
+            for writer in writers:
+                writer.close()
+            raise
+        for writer in writers:
+            writer.finalize()
+
+        if cache is not None:
+            cache.prune(files)
+            cache.save()
+
+    def write_cached_poscar(self, file):
+        """Writes the POSCAR of a snapshot that was not reanalyzed, unless an up-to-date one exists."""
+        poscar = Path(f"{file}.POSCAR")
+        if poscar.exists() and poscar.stat().st_mtime >= file.stat().st_mtime:
+            return
+        try:
+            write_poscar(file, sqs2atoms(file, scale=self.scale))
+        except Exception as e:
+            print(f"{file.name}: {type(e).__name__}: {e}")
+            return
+        print(poscar.name)
+
+    def iter_new_results(self, files):
+        """
+        Yields (file, result) for every file in order, as soon as it is analyzed.
+        The shared-lattice path evaluates batch_size files at a time in one
+        bincount; files it cannot handle and all files otherwise go through
+        calculate_files one by one.
+        """
+        if not self.shared_lattice:
+            yield from self.iter_files(files)
+            return
+        for start in range(0, len(files), self.batch_size):
+            batch = files[start:start + self.batch_size]
+            shared = self.calculate_shared_lattice_sros(batch)
+            others = self.iter_files([file for file in batch if file not in shared])
+            for file in batch:
+                yield (file, shared[file]) if file in shared else next(others)
+
+    def update(self, outputs):
+        """
+        One incremental pass: analyzes new or modified snapshots (with the cache
+        enabled) and rewrites the output files if anything changed. An idle pass
+        only stats the folder.
+        """
+        if not self.cache:
+            self.cache = True
+        self.calculate_all_sros(outputs, only_if_changed=True)
 
     def calculate_sros(self, file_name):
         atoms=sqs2atoms(file_name,scale=self.scale,write_POSCAR=self.write_poscar)
@@ -52,20 +276,267 @@ class SQS_Analyzer:
         
         return atoms.todict(), sro_data
 
+    def calculate_files(self, files):
+        """
+        Analyzes files one by one, or spread over a process pool when workers > 1.
+        Returns {file: {"sros": ...}} in the order of files; a file that fails is
+        reported and mapped to None instead of aborting the run.
+        """
+        return dict(self.iter_files(files))
 
+    def iter_files(self, files):
+        """Yields (file, result) of calculate_files in file order, each as soon as it is done."""
+        local_bins = self.local_bins if self.local_sro else None
+        profile = self.instrumentation is not None
+        jobs = [(file, self.scale, self.cutoffs, self.weights, self.write_poscar, local_bins, profile) for file in files]
+        with contextlib.ExitStack() as stack:
+            if self.workers > 1 and len(jobs) > 1:
+                chunksize = self.chunksize or max(1, len(jobs) // (4 * self.workers))
+                pool = stack.enter_context(ProcessPoolExecutor(max_workers=self.workers))
+                results = pool.map(analyze_file, jobs, chunksize=chunksize)
+            else:
+                results = map(analyze_file, jobs)
 
-if __name__=="__main__":
+            # results arrive in file order as they complete
+            for file, (result, error, seconds, times) in zip(files, results):
+                if error is not None:
+                    print(f"{file.name}: {error}")
+                if profile:
+                    self.instrumentation.file_done(file.name, seconds, times)
+                yield file, result
 
-    folder="./"
-    scale=3.13275
-    cutoffs = [
-        2.9229,
-        3.7816,
-    ]
-    weights=[8,6]
-    sqs_analysis=SQS_Analyzer(folder,scale,cutoffs,weights)
-    sqs_analysis.calculate_all_sros()
-    
-    with open("results.json", 'w') as fp:
-        json.dump(sqs_analysis.all_data, fp, indent=4)
-    
+    def calculate_shared_lattice_sros(self, files):
+        """
+        Ensemble mode: builds the site neighbor list from the snapshot with the most
+        sites and evaluates every snapshot with the same cell and sites as one
+        integer species vector in a single batched bincount. Returns {file: {"sros":
+        ...}}; unreadable files and files whose geometry differs are left out and
+        analyzed one by one.
+        """
+        profile = self.instrumentation is not None
+        parsed = {}
+        parse_times = {}
+        for file in files:
+            timer = StageTimer() if profile else NULL_TIMER
+            try:
+                with timer.stage("parse"):
+                    basis_vectors, lattice_vectors, atomic_positions, atomic_species = read_bestsqs(file)
+            except Exception:
+                # unreadable files are reported by the per-file path
+                continue
+            if not set(atomic_species) <= atomic_numbers.keys():
+                # so are unknown element symbols, which would abort the whole batch here
+                continue
+            if lattice_vectors.shape != (3, 3) or not len(atomic_species):
+                # and empty or cut-off files
+                continue
+            parsed[file] = (lattice_vectors * self.scale, atomic_positions * self.scale, np.asarray(atomic_species))
+            parse_times[file] = timer.times
+        files = list(parsed)
+        if not files:
+            return {}
+        timer = StageTimer() if profile else NULL_TIMER
+
+        order = np.argsort(self.cutoffs)
+        cutoffs = [self.cutoffs[k] for k in order]
+        weights = [self.weights[k] for k in order]
+        # a file still being written has fewer sites, so it does not become the reference
+        reference = max(files, key=lambda file: len(parsed[file][2]))
+        lattice_vectors, atomic_positions, atomic_species = parsed[reference]
+        with timer.stage("neighbor_search"):
+            neighbors = shared_site_neighbors(bestsqs_to_atoms(lattice_vectors, atomic_positions, atomic_species, sort=False), cutoffs)
+
+        matched = [file for file in files if neighbors.matches(parsed[file][1], parsed[file][0])]
+        for file in files:
+            if file not in matched:
+                print(f"{file.name}: geometry differs from {reference.name}, analyzing separately")
+
+        # species ordered by atomic number, as in the sorted Atoms of sqs2atoms
+        species = sorted({str(x) for file in matched for x in parsed[file][2]}, key=lambda x: atomic_numbers[x])
+        codes = {x: n for n, x in enumerate(species)}
+        types = np.empty((len(matched), neighbors.n_sites), dtype=np.int64)
+        for row, file in enumerate(matched):
+            unique, inverse = np.unique(parsed[file][2], return_inverse=True)
+            types[row] = np.array([codes[str(x)] for x in unique])[inverse]
+
+        with timer.stage("count"):
+            tables = ensemble_sro_tables(neighbors, types, len(species), weights)
+            counts = np.stack([np.bincount(t, minlength=len(species)) for t in types]) if len(matched) else []
+        results = {}
+        for file, t, table, count in zip(matched, types, tables, counts):
+            with timer.stage("count"):
+                present = [x for x, c in zip(species, count) if c > 0]
+                results[file] = {"sros": sro_table_to_dict(species, table, present)}
+            if self.local_sro:
+                with timer.stage("local_sro"):
+                    local = local_sro(neighbors.i, neighbors.j, neighbors.shell, t, len(species), neighbors.n_shell)
+                    edges, hist = local_sro_histograms(local, t, count / len(t), self.local_bins)
+                    results[file]["local_sros"] = local_histograms_to_dict(species, edges, hist, present)
+            if self.write_poscar:
+                with timer.stage("poscar"):
+                    write_poscar(file, bestsqs_to_atoms(*parsed[file]))
+
+        if profile:
+            # the shared stages are attributed evenly to the snapshots that used them
+            shared = {name: seconds / len(matched) for name, seconds in timer.times.items()} if matched else {}
+            for file in matched:
+                times = dict(parse_times[file], **shared)
+                self.instrumentation.file_done(file.name, sum(times.values()), times)
+        return results
+
+
+# SiteNeighbors and shells of recently analyzed lattices, reused by every analyzer in the process
+_site_neighbors = OrderedDict()
+_shell_cutoffs = OrderedDict()
+
+
+def lattice_key(atoms, params):
+    """Hash of the cell and positions of atoms and params."""
+    return hashlib.sha256(np.asarray(params, dtype=float).tobytes()
+                          + np.asarray(atoms.get_cell()).tobytes()
+                          + atoms.get_positions().tobytes()).hexdigest()
+
+
+def lattice_cached(cache, atoms, params, build, maxsize=4):
+    """Looks up build() in an LRU dict keyed by the cell and positions of atoms and params."""
+    key = lattice_key(atoms, params)
+    if key in cache:
+        cache.move_to_end(key)
+    else:
+        cache[key] = build()
+        while len(cache) > maxsize:
+            cache.popitem(last=False)
+    return cache[key]
+
+
+def same_lattice(a, b):
+    """Whether two Atoms have the same number of sites and the same cell."""
+    return len(a) == len(b) and np.allclose(a.get_cell(), b.get_cell())
+
+
+def shared_site_neighbors(atoms, cutoffs):
+    """Returns the SiteNeighbors of these sites and cutoffs, reusing an earlier search on the same lattice."""
+    return lattice_cached(_site_neighbors, atoms, cutoffs, lambda: SiteNeighbors(atoms, cutoffs))
+
+
+def shared_shell_cutoffs(atoms, n_shells):
+    """find_shell_cutoffs of these sites, reusing an earlier result on the same lattice."""
+    return lattice_cached(_shell_cutoffs, atoms, [n_shells], lambda: find_shell_cutoffs(atoms, n_shells))
+
+
+def analyze_file(job):
+    """
+    Process pool task: returns ({"sros": ...}, None, seconds, stage times) for one
+    bestsqs file, or (None, error message, ...) if it cannot be analyzed. With
+    local_bins set the per-atom SRO histograms are added as "local_sros"; stage
+    times are only measured when profile is set.
+    """
+    file, scale, cutoffs, weights, write_POSCAR, local_bins, profile = job
+    timer = StageTimer() if profile else NULL_TIMER
+    start = time.perf_counter()
+    try:
+        with timer.stage("parse"):
+            basis_vectors, lattice_vectors, atomic_positions, atomic_species = read_bestsqs(file)
+        with timer.stage("build_atoms"):
+            atoms = bestsqs_to_atoms(lattice_vectors, atomic_positions, atomic_species, scale)
+        if write_POSCAR:
+            with timer.stage("poscar"):
+                write_poscar(file, atoms)
+        with timer.stage("neighbor_search"):
+            neighbors = SiteNeighbors(atoms, cutoffs)
+        with timer.stage("count"):
+            sro = SRO(atoms, cutoffs, weights, neighbors=neighbors)
+            result = {"sros": sro.get_all_sro()}
+        if local_bins:
+            with timer.stage("local_sro"):
+                result["local_sros"] = sro.get_local_sro_histograms(local_bins)
+        return result, None, time.perf_counter() - start, timer.times
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}", time.perf_counter() - start, timer.times
+
+
+def write_results(all_data, filename):
+    """
+    Writes a list of records atomically, so readers never see a partial file: the
+    columnar NPZ format for *.npz file names, NDJSON for *.ndjson and *.jsonl,
+    results.json otherwise.
+    """
+    with ResultsWriter(filename) as writer:
+        for record in all_data:
+            writer.write(record)
+
+
+def sqs_id(file):
+    """The number of a bestsqs-N.out file (the last number in the name before the suffix), or None."""
+    match = re.search(r"(\d+)\D*$", Path(file).stem)
+    return int(match.group(1)) if match else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calculate the SROs of every bestsqs-*.out file in one or more mcsqs run folders")
+    parser.add_argument("folders", nargs="*", default=["./"], help="run folders (default: the current folder)")
+    parser.add_argument("--scale", type=float, default=3.13275, help="lattice constant the bestsqs coordinates are scaled by")
+    parser.add_argument("--cutoffs", type=float, nargs="+",
+                        help="shell cutoffs in Angstrom (default: halfway between the coordination shells of the first snapshot)")
+    parser.add_argument("--weights", type=float, nargs="+",
+                        help="shell weights of the averaged SRO (default: the coordination numbers of the shells)")
+    parser.add_argument("--shells", type=int, default=2, help="number of shells when the cutoffs are found automatically")
+    parser.add_argument("--pattern", default=DEFAULT_PATTERN, help="glob of the snapshot files in each folder")
+    parser.add_argument("--output", default="results", help="name of the results file written in each folder, without suffix")
+    parser.add_argument("--format", choices=["json", "npz", "both", "ndjson"], default="json",
+                        help="write results.json, the binary results.npz, both, or results.ndjson")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of worker processes for the files analyzed one by one "
+                             "(all files with --no-shared-lattice, otherwise those whose geometry differs)")
+    parser.add_argument("--no-shared-lattice", action="store_true", help="run a neighbor search for every file")
+    parser.add_argument("--no-cache", action="store_true", help="reanalyze every file instead of reusing .sro_cache.json")
+    parser.add_argument("--watch", action="store_true", help="keep polling the folders and update the results as new files appear")
+    parser.add_argument("--interval", type=float, default=10.0, help="seconds between polls in --watch mode")
+    parser.add_argument("--poscar", action="store_true", help="also write a bestsqs-N.out.POSCAR for every analyzed file")
+    parser.add_argument("--local-sro", action="store_true", help="add per-atom SRO histograms to the results")
+    parser.add_argument("--profile", action="store_true", help="report per-stage timings, throughput and peak memory")
+    parser.add_argument("--profile-log", help="write the profiling events as JSON lines to this file instead of stderr")
+    args = parser.parse_args(argv)
+    if args.cutoffs and args.weights and len(args.cutoffs) != len(args.weights):
+        parser.error("--cutoffs and --weights need the same number of values")
+
+    instrumentation = Instrumentation(args.profile_log) if args.profile or args.profile_log else None
+    suffixes = {"json": [".json"], "npz": [".npz"], "both": [".json", ".npz"], "ndjson": [".ndjson"]}[args.format]
+    # one analyzer per folder, all in this process so imports and lattices are shared
+    sessions = []
+    for folder in args.folders:
+        sqs_analysis = SQS_Analyzer(folder, args.scale, args.cutoffs, args.weights,
+                                    write_poscar=args.poscar,
+                                    shared_lattice=not args.no_shared_lattice,
+                                    workers=args.workers,
+                                    cache=not args.no_cache,
+                                    local_sro=args.local_sro,
+                                    instrumentation=instrumentation,
+                                    pattern=args.pattern,
+                                    n_shells=args.shells)
+        outputs = [Path(folder) / f"{args.output}{suffix}" for suffix in suffixes]
+        sessions.append((sqs_analysis, outputs))
+
+    if args.watch:
+        # stay out of the way of the mcsqs jobs we are following
+        if hasattr(os, "nice"):
+            os.nice(10)
+        try:
+            while True:
+                for sqs_analysis, outputs in sessions:
+                    sqs_analysis.update(outputs)
+                time.sleep(args.interval)
+        except KeyboardInterrupt:
+            pass
+    else:
+        for sqs_analysis, outputs in sessions:
+            # streamed to <output>.part while running, so an interrupted run keeps its results
+            sqs_analysis.calculate_all_sros(outputs)
+
+    if instrumentation is not None:
+        print(instrumentation.summary(), file=sys.stderr)
+        instrumentation.close()
+
+
+if __name__=="__main__":
+    main()
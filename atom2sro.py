@@ -1,83 +1,407 @@
 from itertools import combinations_with_replacement
 import numpy as np
-from ase.io import read, write
 from ase.data import atomic_numbers, atomic_masses
-from ase.visualize import view
-from ase.neighborlist import neighbor_list
-from collections import Counter
-from collections import defaultdict
-from pathlib import Path
+
+
+def species_codes(symbols):
+    """
+    Maps chemical symbols to integer codes in order of first appearance.
+    Returns the list of unique species and the integer code of every atom.
+    """
+    species, first, types = np.unique(np.asarray(symbols), return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    remap = np.empty_like(order)
+    remap[order] = np.arange(len(order))
+    return [str(species[k]) for k in order], remap[types]
+
+
+def shell_index(distances, cutoffs):
+    """
+    Bins neighbor distances into shells: shell k holds cutoffs[k-1] <= d < cutoffs[k],
+    matching the strict d < cutoff test of ase.neighborlist.neighbor_list.
+    """
+    return np.searchsorted(cutoffs, distances, side="right")
+
+
+def find_shell_cutoffs(atoms, n_shells=2, tol=0.02):
+    """
+    Finds the first n_shells coordination shells of atoms from the sorted pair
+    distances of one neighbor search: distances closer than tol times the nearest
+    neighbor distance belong to the same shell. Returns the cutoffs halfway between
+    each shell and the next (rounded to 1e-4) and the mean coordination number of
+    every shell, as lists.
+    """
+    from ase.neighborlist import neighbor_list
+    # twice the radius per atom reaches the 3rd shell of bcc and fcc
+    radius = 2 * (atoms.get_volume() / len(atoms)) ** (1 / 3)
+    for _ in range(4):
+        d = np.sort(neighbor_list("d", atoms, radius))
+        # last index of every shell but the outermost, which may be cut off by the radius
+        ends = np.flatnonzero(np.diff(d) > tol * d[0]) if len(d) else d
+        if len(ends) >= n_shells:
+            ends = ends[:n_shells]
+            cutoffs = np.round((d[ends] + d[ends + 1]) / 2, 4)
+            return cutoffs.tolist(), coordination_numbers(np.diff(ends + 1, prepend=0), len(atoms))
+        radius *= 1.5
+    raise ValueError(f"Found fewer than {n_shells + 1} neighbor shells within {radius / 1.5:.3f}")
+
+
+def coordination_numbers(bonds_per_shell, n_atoms):
+    """Mean neighbors per atom in every shell, as ints where they are whole numbers."""
+    coordination = (np.asarray(bonds_per_shell) / n_atoms).tolist()
+    return [int(c) if c.is_integer() else c for c in coordination]
+
+
+def shell_pair_counts(types, i, j, shell, n_species, n_shell):
+    """
+    Counts the ordered (i, j) bonds by shell and species pair with a single bincount.
+    Returns an (n_shell, n_species, n_species) array of per-shell-exclusive counts.
+    """
+    codes = (shell * n_species + types[i]) * n_species + types[j]
+    counts = np.bincount(codes, minlength=n_shell * n_species * n_species)
+    return counts.reshape(n_shell, n_species, n_species)
+
+
+def warren_cowley(pair_counts, concentrations, total_bond):
+    """
+    Warren-Cowley parameters alpha_AB = 1 - N_AB / (c_A c_B N_bond) for a stack of
+    (n_species, n_species) pair count matrices with one bond total per matrix.
+    Leading snapshot axes are broadcast: pair_counts (..., n_shell, n, n),
+    concentrations (..., n) and total_bond (..., n_shell).
+    """
+    c = np.asarray(concentrations, dtype=float)
+    total_bond = np.asarray(total_bond, dtype=float)
+    random = (c[..., np.newaxis, :, np.newaxis] * c[..., np.newaxis, np.newaxis, :]) * total_bond[..., np.newaxis, np.newaxis]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 1 - pair_counts / random
+
+
+def sro_table(alphas, shell_weights):
+    """
+    Rounds the per-shell parameters to 3 decimals and appends their weighted
+    average as a last shell, giving an (..., n_shell + 1, n, n) array.
+    """
+    sros = np.round(alphas, 3)
+    avg_sro = sros[..., 0, :, :] * shell_weights[0]
+    for k, weight in enumerate(shell_weights[1:], start=1):
+        avg_sro = avg_sro + sros[..., k, :, :] * weight
+    avg_sro = avg_sro / sum(shell_weights)
+    return np.concatenate([sros, np.round(avg_sro, 3)[..., np.newaxis, :, :]], axis=-3)
+
+
+class SiteNeighbors:
+    """
+    Neighbor pairs of a fixed set of lattice sites, binned into shells once and
+    reused for every species assignment on that lattice (e.g. all bestsqs-*.out
+    snapshots of one mcsqs run). Only positions and cell of atoms are used.
+    """
+    def __init__(self, atoms, cutoffs) -> None:
+        self.cutoffs = sorted(cutoffs)
+        self.positions = atoms.get_positions()
+        self.cell = np.array(atoms.get_cell())
+        self.n_sites = len(atoms)
+        # imported here: ase.neighborlist alone takes about half a second to load
+        from ase.neighborlist import neighbor_list
+        self.i, self.j, d = neighbor_list("ijd", atoms, self.cutoffs[-1])
+        self.shell = shell_index(d, self.cutoffs)
+        self._adjacency = None
+
+    @property
+    def n_shell(self):
+        return len(self.cutoffs)
+
+    def coordination(self):
+        """Mean number of neighbors of a site in every (exclusive) shell."""
+        return coordination_numbers(np.bincount(self.shell, minlength=self.n_shell), self.n_sites)
+
+    def matches(self, positions, cell, atol=1e-6):
+        """Checks whether a structure sits on exactly these sites, in the same order."""
+        return (
+            np.shape(positions) == self.positions.shape
+            and np.allclose(cell, self.cell, atol=atol)
+            and np.allclose(positions, self.positions, atol=atol)
+        )
+
+    def adjacency(self):
+        """
+        Bonds grouped by their first site (CSR layout): the bonds of site p are
+        j[start[p]:start[p + 1]] with shells shell[start[p]:start[p + 1]].
+        """
+        if self._adjacency is None:
+            order = np.argsort(self.i, kind="stable")
+            start = np.searchsorted(self.i[order], np.arange(self.n_sites + 1))
+            self._adjacency = start, self.j[order], self.shell[order]
+        return self._adjacency
+
+    def pair_counts(self, types, n_species):
+        """Per-shell-exclusive (n_shell, n_species, n_species) pair counts of one snapshot."""
+        return shell_pair_counts(types, self.i, self.j, self.shell, n_species, self.n_shell)
+
+    def pair_counts_batch(self, types, n_species, max_bonds=1 << 22):
+        """
+        Per-shell-exclusive pair counts of a (n_snapshots, n_sites) species matrix,
+        returned as (n_snapshots, n_shell, n_species, n_species). Snapshots are
+        processed in chunks of at most max_bonds gathered bonds to bound memory.
+        """
+        types = np.asarray(types)
+        n_snap = len(types)
+        block = self.n_shell * n_species * n_species
+        base = self.shell * n_species * n_species
+        counts = np.empty((n_snap, block), dtype=np.int64)
+        chunk = max(1, max_bonds // max(1, len(self.i)))
+        for start in range(0, n_snap, chunk):
+            t = types[start:start + chunk]
+            offsets = np.arange(len(t))[:, np.newaxis] * block
+            codes = offsets + base + t[:, self.i] * n_species + t[:, self.j]
+            counts[start:start + len(t)] = np.bincount(codes.ravel(), minlength=len(t) * block).reshape(len(t), block)
+        return counts.reshape(n_snap, self.n_shell, n_species, n_species)
+
+
+def ensemble_sro_tables(neighbors, types, n_species, shell_weights, cumulative=True):
+    """
+    SRO tables of every snapshot on a shared lattice in one batched pass.
+    types is an (n_snapshots, n_sites) matrix of species codes; returns an
+    (n_snapshots, n_shell + 1, n_species, n_species) array as SRO.get_sro_table.
+    """
+    types = np.asarray(types)
+    counts = neighbors.pair_counts_batch(types, n_species)
+    if cumulative:
+        counts = np.cumsum(counts, axis=1)
+    total_bond = counts.sum(axis=(2, 3))
+    concentrations = np.stack([np.bincount(t, minlength=n_species) for t in types]) / types.shape[1]
+    alphas = warren_cowley(counts, concentrations, total_bond)
+    return sro_table(alphas, shell_weights)
+
+
+class SwapSRO:
+    """
+    SRO of one species assignment on a SiteNeighbors lattice that keeps the pair
+    counts of every shell and updates them in O(coordination number) when two
+    sites exchange their species, for local exploration and Monte Carlo.
+    """
+    def __init__(self, neighbors, types, n_species, cumulative=True) -> None:
+        self.neighbors = neighbors
+        self.types = np.array(types, dtype=np.int64)
+        self.n_species = n_species
+        self.cumulative = cumulative
+        self.start, self.j, self.shell = neighbors.adjacency()
+        # per-shell-exclusive counts; species swaps keep concentrations and bond totals
+        self.counts = neighbors.pair_counts(self.types, n_species)
+        self.concentrations = np.bincount(self.types, minlength=n_species) / len(self.types)
+        self._block = neighbors.n_shell * n_species * n_species
+
+    def swap_delta(self, p, q):
+        """Change of the (n_shell, n_species, n_species) pair counts if sites p and q swap species."""
+        n = self.n_species
+        t = self.types
+        if t[p] == t[q]:
+            return np.zeros_like(self.counts)
+        bonds_p = slice(self.start[p], self.start[p + 1])
+        bonds_q = slice(self.start[q], self.start[q + 1])
+        i = np.concatenate([np.full(bonds_p.stop - bonds_p.start, p), np.full(bonds_q.stop - bonds_q.start, q)])
+        j = np.concatenate([self.j[bonds_p], self.j[bonds_q]])
+        shell = np.concatenate([self.shell[bonds_p], self.shell[bonds_q]])
+        ti, tj = t[i], t[j]
+        # species after the swap
+        swap = {p: t[q], q: t[p]}
+        new_ti = np.where(i == p, swap[p], swap[q])
+        new_tj = np.where(j == p, swap[p], np.where(j == q, swap[q], tj))
+        # bonds between p and q (or their images) appear in both directions in
+        # these rows already; the others also stand for their reverse bond
+        outer = (j != p) & (j != q)
+        base = shell * n * n
+        removed = np.concatenate([base + ti * n + tj, (base + tj * n + ti)[outer]])
+        added = np.concatenate([base + new_ti * n + new_tj, (base + new_tj * n + new_ti)[outer]])
+        delta = np.bincount(added, minlength=self._block) - np.bincount(removed, minlength=self._block)
+        return delta.reshape(self.counts.shape)
+
+    def swap(self, p, q, delta=None):
+        """Swaps the species of sites p and q, reusing a delta from swap_delta if given."""
+        if delta is None:
+            delta = self.swap_delta(p, q)
+        self.counts += delta
+        self.types[p], self.types[q] = self.types[q], self.types[p]
+
+    def alphas(self, counts=None):
+        """(n_shell, n_species, n_species) Warren-Cowley parameters of the current (or given) counts."""
+        if counts is None:
+            counts = self.counts
+        if self.cumulative:
+            counts = np.cumsum(counts, axis=0)
+        return warren_cowley(counts, self.concentrations, counts.sum(axis=(1, 2)))
+
+
+def local_sro(i, j, shell, types, n_species, n_shell, cumulative=True):
+    """
+    Per-atom Warren-Cowley parameters alpha_i(B) = 1 - n_i(B) / (c_B Z_i) from the
+    neighbor composition of every atom, as an (n_shell, n_atoms, n_species) array.
+    The site x species counts come from one bincount, so memory stays linear in
+    the number of atoms.
+    """
+    n_atoms = len(types)
+    codes = (shell * n_atoms + i) * n_species + types[j]
+    counts = np.bincount(codes, minlength=n_shell * n_atoms * n_species).reshape(n_shell, n_atoms, n_species)
+    if cumulative:
+        counts = np.cumsum(counts, axis=0)
+    c = np.bincount(types, minlength=n_species) / n_atoms
+    coordination = counts.sum(axis=2, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 1 - counts / (c * coordination)
+
+
+def local_sro_histograms(local, types, concentrations, n_bins=40):
+    """
+    Histograms an (n_shell, n_atoms, n_species) local SRO array by shell, central
+    species A and neighbor species B with one bincount. The shared bin edges span
+    the attainable range [1 - 1 / min(c), 1]. Returns (edges, hist) with hist of
+    shape (n_shell, n_species, n_species, n_bins).
+    """
+    n_shell, n_atoms, n_species = local.shape
+    concentrations = np.asarray(concentrations)
+    low = 1 - 1 / np.min(concentrations[concentrations > 0])
+    edges = np.linspace(low, 1, n_bins + 1)
+    bins = np.clip(np.searchsorted(edges, local, side="right") - 1, 0, n_bins - 1)
+    valid = np.isfinite(local)
+    shell = np.arange(n_shell)[:, np.newaxis, np.newaxis]
+    center = types[np.newaxis, :, np.newaxis]
+    neighbor = np.arange(n_species)[np.newaxis, np.newaxis, :]
+    codes = ((shell * n_species + center) * n_species + neighbor) * n_bins + bins
+    hist = np.bincount(codes[valid], minlength=n_shell * n_species * n_species * n_bins)
+    return edges, hist.reshape(n_shell, n_species, n_species, n_bins)
+
+
+def local_histograms_to_dict(species, edges, hist, elements_list=None):
+    """
+    Converts local SRO histograms into {"edges": [...], "AB": [[shell counts], ...]},
+    where "AB" is the distribution of alpha_i(B) over the atoms i of species A.
+    """
+    if elements_list is None:
+        elements_list = species
+    index = {s: n for n, s in enumerate(species)}
+    data = {"edges": np.round(edges, 6).tolist()}
+    for A, B in sro_pairs(elements_list):
+        data[f"{A}{B}"] = hist[:, index[A], index[B]].tolist()
+    return data
+
+
+def sort_by_atomic_weight(element1, element2):
+    # Get the atomic weights of the elements
+    atomic_weight1 = atomic_masses[atomic_numbers[element1]]
+    atomic_weight2 = atomic_masses[atomic_numbers[element2]]
+
+    # Sort the elements by their atomic weight
+    if atomic_weight1 < atomic_weight2:
+        return element1, element2
+    else:
+        return element2, element1
+
+
+def sro_pairs(elements_list):
+    """
+    Returns the unique (A, B) pairs of elements_list with the lighter element
+    first, in the order the "AB" keys of the SRO results appear.
+    """
+    unique = list(dict.fromkeys(elements_list))
+    return [sort_by_atomic_weight(A, B) for A, B in combinations_with_replacement(unique, 2)]
+
+
+def sro_table_to_dict(species, sros, elements_list=None):
+    """
+    Converts an (n_shell + 1, n_species, n_species) table into the
+    {"AB": [shell values..., average]} form written to results.json.
+    """
+    if elements_list is None:
+        elements_list = species
+    index = {s: n for n, s in enumerate(species)}
+    return {f"{A}{B}": list(sros[:, index[A], index[B]]) for A, B in sro_pairs(elements_list)}
 
 
 class SRO:
-    def __init__(self, atoms, cutoffs, shell_weights) -> None:
-        cutoffs.sort(reverse=True)
+    def __init__(self, atoms, cutoffs, shell_weights, cumulative=True, neighbors=None) -> None:
+        if len(cutoffs) != len(shell_weights):
+            raise ValueError(f"Got {len(cutoffs)} cutoffs but {len(shell_weights)} shell weights")
+        order = np.argsort(cutoffs)
         self.atoms = atoms
-        self.cutoffs = cutoffs
-        self.shell_weights=shell_weights
+        self.cutoffs = [cutoffs[k] for k in order]
+        self.shell_weights = [shell_weights[k] for k in order]
+        # cumulative shells count every bond shorter than the cutoff,
+        # otherwise shell k only holds cutoffs[k-1] <= d < cutoffs[k]
+        self.cumulative = cumulative
+        # optional SiteNeighbors of the same sites, skips the neighbor search
+        self.neighbors = neighbors
         self.elements = list(self.atoms.symbols)
-        self.atom_dict = {k: v for k, v in enumerate(self.elements)}
-        self.atom_ratio = {
-            key: Counter(self.elements)[key] / sum(Counter(self.elements).values())
-            for key in Counter(self.elements).keys()
-        }
-        self._total_bond = []
-        self.ndatas = self.get_neighbor_count()
+        # integer species codes, in order of first appearance
+        self.species, self.types = species_codes(self.elements)
+        self.species_index = {s: n for n, s in enumerate(self.species)}
+        self.concentrations = np.bincount(self.types, minlength=len(self.species)) / len(self.types)
+        self.atom_ratio = dict(zip(self.species, self.concentrations))
+        self.shell_counts = self.get_neighbor_count()
+        self.ndatas = np.cumsum(self.shell_counts, axis=0) if cumulative else self.shell_counts
+        self._total_bond = self.ndatas.sum(axis=(1, 2))
+        self.alphas = self.sro_matrix()
+        self._sro_table = None
 
     def get_neighbor_count(self):
-        nth_shell_counts = []
-        for cutoff in self.cutoffs:
-            i, j = neighbor_list("ij", self.atoms, cutoff)
-            self._total_bond.append(len(i))
-            data = defaultdict(list)
-            for p, q in zip(i, j):
-                data[self.atom_dict[p]].append(self.atom_dict[q])
-            nth_shell_counts.append({key: Counter(data[key]) for key in data.keys()})
-        
-        # print(len(nth_shell_counts))
-
-        # for idx in range(len(nth_shell_counts) - 1):
-        #     for key in nth_shell_counts[idx].keys():
-        #         nth_shell_counts[idx][key].subtract(nth_shell_counts[idx + 1][key])
-        return nth_shell_counts
+        """
+        Runs a single neighbor search at the largest cutoff and bins the distances
+        into shells. Returns an (n_shell, n_species, n_species) array of ordered
+        pair counts per shell, from the smallest cutoff to the largest.
+        """
+        if self.neighbors is not None:
+            self.bonds = self.neighbors.i, self.neighbors.j, self.neighbors.shell
+            return self.neighbors.pair_counts(self.types, len(self.species))
+        from ase.neighborlist import neighbor_list
+        i, j, d = neighbor_list("ijd", self.atoms, self.cutoffs[-1])
+        shell = shell_index(d, self.cutoffs)
+        # kept for the per-atom analysis
+        self.bonds = i, j, shell
+        return shell_pair_counts(self.types, i, j, shell, len(self.species), len(self.cutoffs))
+
+    def sro_matrix(self):
+        """
+        Returns the Warren-Cowley parameters as an (n_shell, n_species, n_species)
+        array, from the smallest cutoff to the largest, in self.species order.
+        """
+        return warren_cowley(self.ndatas, self.concentrations, self._total_bond)
+
+    def get_sro_table(self):
+        """
+        Returns (species, sros) where sros is an (n_shell + 1, n_species, n_species)
+        array holding the rounded per-shell parameters followed by their weighted
+        average, i.e. the same numbers get_all_sro reports for every pair.
+        """
+        if self._sro_table is None:
+            self._sro_table = sro_table(self.alphas, self.shell_weights)
+        return self.species, self._sro_table
+
+    def get_local_sro(self):
+        """
+        Returns the per-atom parameters alpha_i(B) = 1 - n_i(B) / (c_B Z_i) from the
+        species of each atom's own neighbors, as an (n_shell, n_atoms, n_species) array.
+        """
+        i, j, shell = self.bonds
+        return local_sro(i, j, shell, self.types, len(self.species), len(self.cutoffs), self.cumulative)
+
+    def get_local_sro_histograms(self, n_bins=40):
+        """
+        Histograms of the per-atom parameters of every pair and shell, in the
+        {"edges": [...], "AB": [[counts of shell 1], ...]} form of results.json.
+        """
+        edges, hist = local_sro_histograms(self.get_local_sro(), self.types, self.concentrations, n_bins)
+        return local_histograms_to_dict(self.species, edges, hist)
 
     def sro_AB(self, A, B):
-        sros = []
-        for shell_number in range(len(self.cutoffs)):
-            avg_sro=0
-            k=len(self.cutoffs)-shell_number-1
-            R_AB_random = self.atom_ratio[A] * self.atom_ratio[B] * self._total_bond[k]
-            R_AB_mc = self.ndatas[k][A][B]
-            sros.append(np.round((1 - R_AB_mc / R_AB_random),3))
-        
-        avg_sro=(sros[0]*self.shell_weights[0]+sros[1]*self.shell_weights[1])/(self.shell_weights[0]+self.shell_weights[1])
-        sros.append(np.round(avg_sro,3))
-        return sros
+        a, b = self.species_index[A], self.species_index[B]
+        return list(self.get_sro_table()[1][:, a, b])
     
     def sort_by_atomic_weight(self, element1, element2):
-        # Get the atomic numbers of the elements
-        atomic_weight1 = atomic_masses[atomic_numbers[element1]]
-        atomic_weight2 = atomic_masses[atomic_numbers[element2]]
-        
-        # Sort the elements by their atomic weight
-        if atomic_weight1 < atomic_weight2:
-            return element1, element2
-        else:
-            return element2, element1
+        return sort_by_atomic_weight(element1, element2)
 
     def get_all_sro(self, elements_list=None):
-        sro_data = {}
         if elements_list is None:
-            elements_pair = combinations_with_replacement(self.elements, 2)
-        else:
-            elements_pair = combinations_with_replacement(elements_list,2)
-        
-        for A, B in elements_pair:
-            A,B=self.sort_by_atomic_weight(A, B)
-            sro1 = self.sro_AB(A, B)
-            sro_data[f"{A}{B}"] = sro1
-    
-        return sro_data
+            elements_list = self.species
+        species, sros = self.get_sro_table()
+        return sro_table_to_dict(species, sros, elements_list)
 
     def write_sro(self,sro_data,filename):
         with open(filename, "w") as f:
@@ -0,0 +1,236 @@
+import os
+import io
+import sys
+import json
+import time
+import base64
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+from pathlib import Path
+from datetime import datetime
+import numpy as np
+from ase.build import bulk
+
+from sqs2atom import read_bestsqs, sqs2atoms
+from atom2sro import SRO, find_shell_cutoffs
+import analyze_sqs
+from analyze_sqs import SQS_Analyzer, write_results
+
+SPECIES = ["Ti", "V", "Cr", "Nb", "Ta", "W"]
+
+# shell cutoffs (in units of the lattice constant) halfway between the
+# 1st/2nd and 2nd/3rd coordination shells, with the coordination numbers as weights
+SHELLS = {
+    "bcc": ([0.933, 1.207], [8, 6]),
+    "fcc": ([0.854, 1.112], [12, 6]),
+}
+
+
+def supercell_repeat(lattice, n_atoms):
+    """Repetition of the cubic cell giving about n_atoms atoms."""
+    per_cell = {"bcc": 2, "fcc": 4}[lattice]
+    return max(1, round((n_atoms / per_cell) ** (1 / 3)))
+
+
+def random_species(n_sites, n_species, rng):
+    """Equiatomic random occupation of n_sites with the first n_species of SPECIES."""
+    species = np.array(SPECIES[:n_species])[np.arange(n_sites) % n_species]
+    rng.shuffle(species)
+    return species
+
+
+def synthetic_atoms(lattice, n_atoms, n_species, a=3.2, seed=0):
+    rng = np.random.default_rng(seed)
+    atoms = bulk("Fe", lattice, a=a, cubic=True).repeat(supercell_repeat(lattice, n_atoms))
+    atoms.set_chemical_symbols(random_species(len(atoms), n_species, rng))
+    return atoms
+
+
+def write_mcsqs_folder(folder, lattice, n_atoms, n_species, n_snapshots, seed=0):
+    """
+    Writes n_snapshots bestsqs-N.out files on the same sites with random species,
+    in units of the lattice constant like mcsqs does.
+    """
+    rng = np.random.default_rng(seed)
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    cell = bulk("Fe", lattice, a=1.0, cubic=True).repeat(supercell_repeat(lattice, n_atoms))
+    positions = cell.get_positions()
+    header = "".join(f"{x:.6f} {y:.6f} {z:.6f}\n" for x, y, z in np.eye(3))
+    header += "".join(f"{x:.6f} {y:.6f} {z:.6f}\n" for x, y, z in cell.get_cell())
+    for k in range(n_snapshots):
+        species = random_species(len(positions), n_species, rng)
+        body = "".join(f"{x:.6f} {y:.6f} {z:.6f} {s}\n" for (x, y, z), s in zip(positions, species))
+        with open(folder / f"bestsqs-{k}.out", "w") as f:
+            f.write(header + body)
+    return sorted(folder.glob("bestsqs-*.out"))
+
+
+def measure(fn, repeat=3):
+    """
+    Best wall time of repeat calls and the peak traced memory of one call.
+    Returns (seconds, peak MB, last return value).
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak / 2**20, result
+
+
+def cold(fn):
+    """Runs fn with the per-process lattice caches of analyze_sqs emptied first."""
+    def run():
+        analyze_sqs._site_neighbors.clear()
+        analyze_sqs._shell_cutoffs.clear()
+        return fn()
+    return run
+
+
+def quiet(fn):
+    """Runs fn with its prints suppressed."""
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fn()
+    return run
+
+
+def bench_structure(lattice, n_atoms, n_species, repeat):
+    """Parsing, neighbor counting and SRO evaluation of a single structure."""
+    a = 3.2
+    cutoffs, weights = SHELLS[lattice]
+    cutoffs = [c * a for c in cutoffs]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        file = write_mcsqs_folder(tmp, lattice, n_atoms, n_species, 1)[0]
+        atoms = sqs2atoms(file, scale=a)
+        sro = SRO(atoms, cutoffs, weights)
+        cases = {
+            "read_bestsqs": lambda: read_bestsqs(file),
+            "sqs2atoms": lambda: sqs2atoms(file, scale=a),
+            "find_shell_cutoffs": lambda: find_shell_cutoffs(atoms, len(cutoffs)),
+            "SRO.get_neighbor_count": sro.get_neighbor_count,
+            "SRO.get_all_sro": lambda: SRO(atoms, cutoffs, weights).get_all_sro(),
+        }
+        for name, fn in cases.items():
+            seconds, peak, _ = measure(fn, repeat)
+            results.append(dict(name=name, lattice=lattice, n_atoms=len(atoms), n_species=n_species,
+                                wall_s=seconds, peak_mb=peak, structures_per_s=1 / seconds))
+    return results
+
+
+def bench_folder(lattice, n_atoms, n_species, n_snapshots, repeat, dashboard=True):
+    """Whole-folder analysis in the per-file and shared-lattice modes, then the dashboard callbacks."""
+    a = 3.2
+    cutoffs, weights = SHELLS[lattice]
+    cutoffs = [c * a for c in cutoffs]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        files = write_mcsqs_folder(tmp, lattice, n_atoms, n_species, n_snapshots)
+        n_sites = len(read_bestsqs(files[0])[3])
+        params = dict(lattice=lattice, n_atoms=n_sites, n_species=n_species, n_snapshots=n_snapshots)
+        for name, shared in [("SQS_Analyzer.calculate_all_sros", False),
+                             ("SQS_Analyzer.calculate_all_sros[shared_lattice]", True)]:
+            analyzer = SQS_Analyzer(tmp, a, cutoffs, weights, shared_lattice=shared)
+            seconds, peak, _ = measure(quiet(cold(analyzer.calculate_all_sros)), repeat)
+            results.append(dict(name=name, **params, wall_s=seconds, peak_mb=peak,
+                                structures_per_s=n_snapshots / seconds))
+        if dashboard:
+            results_file = Path(tmp) / "results.json"
+            write_results(analyzer.all_data, results_file)
+            results += bench_dashboard(results_file, params, repeat)
+    return results
+
+
+def bench_dashboard(results_file, params, repeat):
+    """Times the sqs_plot.py callbacks called directly, without a browser."""
+    import sqs_plot
+
+    contents = "data:application/json;base64," + base64.b64encode(results_file.read_bytes()).decode()
+    # time the figures being built, not the figure store
+    sqs_plot.figures = sqs_plot.DatasetStore(maxsize=0)
+
+    def upload():
+        # parse again every time instead of hitting the dataset store
+        sqs_plot.datasets = sqs_plot.DatasetStore()
+        return sqs_plot.store_upload(contents, results_file.name)[1]
+
+    key = upload()
+    options, interactions, sqs_options, sqs_id, shells, shell = quiet(lambda: sqs_plot.update_controls(key))()
+    cases = {
+        "sqs_plot.store_upload": upload,
+        "sqs_plot.update_controls": lambda: sqs_plot.update_controls(key),
+        "sqs_plot.update_interaction_plot": lambda: sqs_plot.update_interaction_plot(interactions, 0, 0.1, None, key),
+        "sqs_plot.update_spider_chart_and_table": lambda: sqs_plot.update_spider_chart_and_table(sqs_id, -0.5, 0.5, key),
+        "sqs_plot.update_ensemble": lambda: sqs_plot.update_ensemble([{'label': 'run', 'value': key}], interactions, 0, None),
+    }
+    results = []
+    for name, fn in cases.items():
+        seconds, peak, _ = measure(quiet(fn), repeat)
+        results.append(dict(name=name, **params, wall_s=seconds, peak_mb=peak, calls_per_s=1 / seconds))
+    return results
+
+
+def compare(current, baseline):
+    """Prints the speedup of every benchmark present in both runs."""
+    def key(result):
+        return tuple(result.get(k) for k in ("name", "lattice", "n_atoms", "n_species", "n_snapshots"))
+    old = {key(result): result for result in baseline["results"]}
+    for result in current["results"]:
+        if key(result) in old:
+            speedup = old[key(result)]["wall_s"] / result["wall_s"]
+            print(f"{result['name']:50s} {result['lattice']} {result['n_atoms']:>7} atoms "
+                  f"{result['n_species']} species: {speedup:6.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the SQS analysis and dashboard pipeline")
+    parser.add_argument("--lattices", nargs="+", default=["bcc", "fcc"], choices=sorted(SHELLS))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[128, 1024, 8192], help="approximate atoms per cell")
+    parser.add_argument("--species", type=int, nargs="+", default=[2, 4, 6], help="numbers of species")
+    parser.add_argument("--snapshots", type=int, default=20, help="bestsqs files per synthetic run folder")
+    parser.add_argument("--folder-max-atoms", type=int, default=2048, help="largest cell used for folder benchmarks")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-dashboard", action="store_true", help="skip the dashboard callbacks")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--compare", help="earlier benchmark JSON to compare against")
+    args = parser.parse_args()
+
+    results = []
+    for lattice in args.lattices:
+        for n_atoms in args.sizes:
+            for n_species in args.species:
+                print(f"{lattice} {n_atoms} atoms {n_species} species", file=sys.stderr)
+                results += bench_structure(lattice, n_atoms, n_species, args.repeat)
+                if n_atoms <= args.folder_max_atoms:
+                    results += bench_folder(lattice, n_atoms, n_species, args.snapshots, args.repeat,
+                                            dashboard=not args.no_dashboard)
+
+    import ase
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "ase": ase.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {len(results)} benchmarks to {args.output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
@@ -0,0 +1,118 @@
+import sys
+import json
+import time
+import resource
+from contextlib import contextmanager, nullcontext
+
+_NO_STAGE = nullcontext()
+
+
+class StageTimer:
+    """Accumulates wall time per named stage of the analysis of one file."""
+    def __init__(self) -> None:
+        self.times = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name] = self.times.get(name, 0.0) + time.perf_counter() - start
+
+
+class NullTimer:
+    """Stand-in for StageTimer when instrumentation is off; every stage is a shared no-op."""
+    times = {}
+
+    def stage(self, name):
+        return _NO_STAGE
+
+
+NULL_TIMER = NullTimer()
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and its (finished) worker processes."""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in kB on Linux and in bytes on macOS
+    scale = 1 / 2**20 if sys.platform == "darwin" else 1 / 2**10
+    return max(own, children) * scale
+
+
+class Instrumentation:
+    """
+    Progress and hot-path timing of an SQS_Analyzer run.
+
+    Per-file stage times measured in the workers are merged here, so serial and
+    parallel runs report the same quantities. Every finished file is emitted as a
+    JSON line (to log, a path or file object; stderr by default) with its
+    duration, stage times, throughput and ETA, and summary() closes the run.
+    """
+    def __init__(self, log=None) -> None:
+        self._own_log = isinstance(log, str)
+        self.log = open(log, "a") if self._own_log else (log or sys.stderr)
+        self.stages = {}
+        self.n_files = 0
+        self.total = 0
+        self.start_time = None
+
+    def timer(self):
+        return StageTimer()
+
+    def start(self, total):
+        """Starts (or extends) a run with total more files to analyze."""
+        if self.start_time is None:
+            self.start_time = time.perf_counter()
+        self.total += total
+
+    def add_stages(self, times):
+        for name, seconds in times.items():
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def file_done(self, name, seconds, times):
+        self.n_files += 1
+        self.add_stages(times)
+        elapsed = time.perf_counter() - self.start_time
+        rate = self.n_files / elapsed if elapsed > 0 else 0.0
+        self.emit(
+            event="file",
+            name=name,
+            seconds=round(seconds, 6),
+            stages={k: round(v, 6) for k, v in times.items()},
+            done=self.n_files,
+            total=self.total,
+            structures_per_s=round(rate, 3),
+            eta_s=round((self.total - self.n_files) / rate, 1) if rate else None,
+            peak_rss_mb=round(peak_rss_mb(), 1),
+        )
+
+    def emit(self, **event):
+        self.log.write(json.dumps(event) + "\n")
+        self.log.flush()
+
+    def summary(self):
+        """Emits the summary event and returns it as a printable table."""
+        elapsed = time.perf_counter() - self.start_time if self.start_time is not None else 0.0
+        rate = self.n_files / elapsed if elapsed > 0 else 0.0
+        self.emit(
+            event="summary",
+            files=self.n_files,
+            seconds=round(elapsed, 6),
+            stages={k: round(v, 6) for k, v in self.stages.items()},
+            structures_per_s=round(rate, 3),
+            peak_rss_mb=round(peak_rss_mb(), 1),
+        )
+        staged = sum(self.stages.values())
+        lines = [f"{'stage':<20}{'seconds':>12}{'share':>8}"]
+        for name, seconds in sorted(self.stages.items(), key=lambda item: -item[1]):
+            share = seconds / staged if staged else 0.0
+            lines.append(f"{name:<20}{seconds:>12.4f}{share:>8.1%}")
+        lines.append(f"{self.n_files} files in {elapsed:.3f} s ({rate:.2f} structures/s), "
+                     f"peak RSS {peak_rss_mb():.1f} MB")
+        return "\n".join(lines)
+
+    def close(self):
+        if self._own_log:
+            self.log.close()
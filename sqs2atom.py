@@ -1,10 +1,62 @@
 from ase import Atoms
-from ase.io import write
+from ase.data import atomic_numbers
 import numpy as np
 
 def read_bestsqs(file):
     """
     Reads the bestsqs.out file and returns the basis vectors, lattice vectors, atomic positions, and element types.
+    The coordinate block is converted in one NumPy pass; files that do not have the
+    plain "x y z element" layout (e.g. extra columns) are read line by line instead.
+    """
+    with open(file, 'r') as f:
+        text = f.read()
+    lines = text.split('\n', 6)
+    header = [line.split() for line in lines[:6]]
+    tokens = lines[6].split() if len(lines) > 6 else []
+    if len(header) < 6 or any(len(line) != 3 for line in header) or len(tokens) % 4:
+        return _read_bestsqs_lines(file)
+
+    basis_vectors = np.array(header[:3], dtype=float)
+    lattice_vectors = np.array(header[3:], dtype=float)
+    # every 4th token is an element, the others are x y z
+    atomic_species = tokens[3::4]
+    try:
+        atomic_positions = np.array([tokens[0::4], tokens[1::4], tokens[2::4]], dtype=float).T
+    except ValueError:
+        # lines with another number of columns shift the tokens
+        return _read_bestsqs_lines(file)
+    if any(not element[:1].isalpha() for element in set(atomic_species)):
+        return _read_bestsqs_lines(file)
+
+    return basis_vectors, lattice_vectors, atomic_positions, atomic_species
+
+def read_bestsqs_batch(files):
+    """
+    Parses many bestsqs.out files of the same size into preallocated arrays:
+    basis (n_files, 3, 3), lattice (n_files, 3, 3), positions (n_files, n_sites, 3)
+    and species (n_files, n_sites).
+    """
+    files = list(files)
+    basis_vectors, lattice_vectors, atomic_positions, atomic_species = read_bestsqs(files[0])
+    n_sites = len(atomic_species)
+    basis = np.empty((len(files), 3, 3))
+    lattice = np.empty((len(files), 3, 3))
+    positions = np.empty((len(files), n_sites, 3))
+    species = np.empty((len(files), n_sites), dtype=object)
+    for k, file in enumerate(files):
+        if k:
+            basis_vectors, lattice_vectors, atomic_positions, atomic_species = read_bestsqs(file)
+        if len(atomic_species) != n_sites:
+            raise ValueError(f"{file} has {len(atomic_species)} sites, expected {n_sites}")
+        basis[k] = basis_vectors
+        lattice[k] = lattice_vectors
+        positions[k] = atomic_positions
+        species[k] = atomic_species
+    return basis, lattice, positions, species
+
+def _read_bestsqs_lines(file):
+    """
+    Line-by-line reader used for bestsqs.out files with an irregular layout.
     """
     basis_vectors = []
     lattice_vectors = []
@@ -36,15 +88,28 @@ def read_bestsqs(file):
     
     return basis_vectors, lattice_vectors, atomic_positions, atomic_species
 
-def sqs2atoms(file,scale=1.0, write_POSCAR=True):
+def bestsqs_to_atoms(lattice_vectors, atomic_positions, atomic_species, scale=1.0, sort=True):
+    """
+    Builds a periodic Atoms object from parsed bestsqs.out arrays, scaled by the
+    lattice constant and (by default) sorted by atomic number.
+    """
+    if sort:
+        # sort the parsed arrays instead of copying a finished Atoms object
+        numbers = np.array([atomic_numbers[x] for x in atomic_species])
+        order = numbers.argsort(kind='stable')
+        atomic_positions = atomic_positions[order]
+        atomic_species = numbers[order]
+    return Atoms(atomic_species, positions=atomic_positions * scale, cell=lattice_vectors * scale, pbc=True)
+
+def write_poscar(file, atoms):
+    # ase.io is slow to import and only needed for POSCAR output
+    from ase.io import write
+    write(f"{file}.POSCAR", atoms, direct=True, format='vasp')
+
+def sqs2atoms(file,scale=1.0, write_POSCAR=False):
     basis_vectors, lattice_vectors, atomic_positions, atomic_species=read_bestsqs(file)
-    lattice_vectors *=scale
-    atomic_positions *=scale
-    
-    atoms = Atoms(symbols=atomic_species, positions=atomic_positions, cell=lattice_vectors, pbc=True)
-    atoms=atoms[atoms.numbers.argsort()]
+    atoms = bestsqs_to_atoms(lattice_vectors, atomic_positions, atomic_species, scale)
 
     if write_POSCAR:
-        id=int(file.name.split(".")[0].split("-")[-1])
-        write(f"{file}.POSCAR", atoms,direct=True, format='vasp')
-    return atoms
\ No newline at end of file
+        write_poscar(file, atoms)
+    return atoms
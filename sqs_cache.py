@@ -0,0 +1,280 @@
+import os
+import json
+import time
+import pickle
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+
+
+def file_hash(file, block_size=1 << 20):
+    h = hashlib.sha256()
+    with open(file, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def params_key(**params):
+    """Stable key of the analysis parameters (scale, cutoffs, weights, ...)."""
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class SROCache:
+    """
+    Persistent per-folder cache of analyzed bestsqs files.
+
+    Entries are keyed by the analysis parameters and the file path relative to
+    root (the run folder, by default the folder of the cache file), so the same
+    folder hits the cache however it was spelled on the command line. A file
+    whose size and mtime are unchanged is a hit without being read; if only the
+    mtime changed the content hash decides.
+
+    The entries of one set of parameters are used at a time (see select()); the
+    cache also keeps the automatically found shells of each lattice (shells).
+
+    Only that index (size, mtime, sha256 and the offset of the result) is kept
+    in memory and saved to path. The results themselves are appended, one JSON
+    line per file, to "<path>.results" as they are stored and read back by
+    offset when needed, so memory does not grow with the number of files and an
+    interrupted run keeps everything it stored: lines written after the last
+    save() are replayed (up to a partially written last line) when the cache is
+    opened. If the index does not belong to the results file, the whole file is
+    replayed.
+    """
+    version = 2
+
+    def __init__(self, path, params=None, root=None) -> None:
+        self.path = Path(path)
+        self.root = Path(root) if root is not None else self.path.parent
+        self.results_path = self.path.with_name(self.path.name + ".results")
+        self.key = None
+        self.entries = None
+        self.data = {}
+        if self.path.is_file():
+            try:
+                with open(self.path) as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError):
+                # a corrupt cache is simply rebuilt
+                self.data = {}
+        if self.data.get("version") != self.version:
+            self.data = {}
+        self.data["version"] = self.version
+        self.index = self.data.setdefault("index", {})
+        # shells found automatically, by lattice, so later runs skip the neighbor search
+        self.shells = self.data.setdefault("shells", {})
+        self._dirty = False
+        self._reader = None
+        self._writer = None
+        # offset after the last complete line, lines in the file, and where the saved index ends
+        self._end, self._lines = 0, 0
+        if self.results_path.is_file():
+            saved = self.data.get("results", {})
+            stat = os.stat(self.results_path)
+            if saved.get("inode") == stat.st_ino and saved.get("size", 0) <= stat.st_size:
+                self._end, self._lines = saved["size"], saved["lines"]
+            else:
+                self.index.clear()
+            self._replay()
+        else:
+            self.index.clear()
+        if params is not None:
+            self.select(params)
+
+    def select(self, params):
+        """Uses the entries of these analysis parameters (scale, cutoffs, weights, ...)."""
+        self.key = params_key(**params)
+        self.entries = self.index.setdefault(self.key, {})
+
+    def store_shells(self, key, shells):
+        self.shells[key] = shells
+        self._dirty = True
+
+    def _replay(self):
+        with open(self.results_path, 'rb') as f:
+            f.seek(self._end)
+            for line in f:
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                self.index.setdefault(item["key"], {})[item["file"]] = dict(item["entry"], offset=self._end)
+                self._end += len(line)
+                self._lines += 1
+                self._dirty = True
+
+    def name(self, file):
+        return Path(os.path.relpath(file, self.root)).as_posix()
+
+    def hit(self, file):
+        """Whether the cached result of file is up to date."""
+        entry = self.entries.get(self.name(file))
+        if entry is None:
+            return False
+        stat = os.stat(file)
+        if stat.st_size != entry["size"]:
+            return False
+        if stat.st_mtime_ns != entry["mtime_ns"]:
+            if file_hash(file) != entry["sha256"]:
+                return False
+            entry["mtime_ns"] = stat.st_mtime_ns
+            self._dirty = True
+        return True
+
+    def load(self, file):
+        """Reads the cached result of file back from the results file."""
+        entry = self.entries[self.name(file)]
+        if self._reader is None:
+            self._reader = open(self.results_path, 'rb')
+        self._reader.seek(entry["offset"])
+        return json.loads(self._reader.readline())["result"]
+
+    def lookup(self, file):
+        return self.load(file) if self.hit(file) else None
+
+    def store(self, file, result):
+        stat = os.stat(file)
+        entry = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": file_hash(file),
+        }
+        name = self.name(file)
+        line = (json.dumps({"key": self.key, "file": name, "entry": entry, "result": result}) + "\n").encode()
+        if self._writer is None:
+            # a reader may have buffered the partial line that is overwritten now
+            self.close()
+            self._writer = open(self.results_path, 'ab')
+            # drop a partially written last line of an interrupted run
+            self._writer.truncate(self._end)
+        self._writer.write(line)
+        self._writer.flush()
+        self.entries[name] = dict(entry, offset=self._end)
+        self._end += len(line)
+        self._lines += 1
+        self._dirty = True
+
+    def prune(self, files):
+        """Drops entries of files that no longer exist in the run folder."""
+        keep = {self.name(file) for file in files}
+        for name in [name for name in self.entries if name not in keep]:
+            del self.entries[name]
+            self._dirty = True
+
+    def compact(self):
+        """Rewrites the results file without the lines of dropped or replaced entries."""
+        tmp = self.results_path.with_name(self.results_path.name + ".tmp")
+        offset = 0
+        with open(self.results_path, 'rb') as src, open(tmp, 'wb') as dst:
+            for entries in self.index.values():
+                for entry in entries.values():
+                    src.seek(entry["offset"])
+                    line = src.readline()
+                    dst.write(line)
+                    entry["offset"] = offset
+                    offset += len(line)
+        self.close()
+        os.replace(tmp, self.results_path)
+        self._end, self._lines = offset, sum(len(entries) for entries in self.index.values())
+        self._dirty = True
+
+    def close(self):
+        for f in (self._reader, self._writer):
+            if f is not None:
+                f.close()
+        self._reader = self._writer = None
+
+    def save(self):
+        live = sum(len(entries) for entries in self.index.values())
+        if self._lines > 2 * live + 64:
+            self.compact()
+        if not self._dirty:
+            return
+        self.close()
+        if self.results_path.exists():
+            stat = os.stat(self.results_path)
+            self.data["results"] = {"inode": stat.st_ino, "size": self._end, "lines": self._lines}
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, 'w') as f:
+            json.dump(self.data, f)
+        os.replace(tmp, self.path)
+        # results of older versions were journaled here
+        legacy = self.path.with_name(self.path.name + ".journal")
+        if legacy.exists():
+            os.remove(legacy)
+        self._dirty = False
+
+
+class DiskStore:
+    """
+    Size-bounded key-value store in an SQLite file, shared by every process that
+    opens the same path (e.g. the workers of a multi-process dashboard).
+
+    Values are pickled, so the file is created private to the current user
+    (directory 0700, file 0600) and a file owned by someone else or writable by
+    others is refused with PermissionError. Nothing is created until the first
+    access. When the stored values exceed max_bytes, the least recently used
+    ones are evicted. Each process and thread gets its own connection.
+    """
+    def __init__(self, path, max_bytes=1 << 30) -> None:
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    def _open_private(self):
+        Path(self.path).parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        os.close(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600))
+        st = os.stat(self.path)
+        if hasattr(os, "getuid") and st.st_uid != os.getuid():
+            raise PermissionError(f"{self.path} is owned by another user")
+        if st.st_mode & 0o022:
+            raise PermissionError(f"{self.path} is writable by other users")
+
+    def _connect(self):
+        # connections must not cross a fork, so they are keyed by the process id
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            self._open_private()
+            db = sqlite3.connect(self.path, timeout=30)
+            # readers do not block the writer
+            db.execute("PRAGMA journal_mode=WAL")
+            with db:
+                db.execute("CREATE TABLE IF NOT EXISTS entries "
+                           "(key TEXT PRIMARY KEY, value BLOB, size INTEGER, accessed REAL)")
+                db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def get(self, key):
+        db = self._connect()
+        row = db.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        with db:
+            db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+        return pickle.loads(row[0])
+
+    def put(self, key, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        db = self._connect()
+        with db:
+            db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                       (key, sqlite3.Binary(blob), len(blob), time.time()))
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total > self.max_bytes:
+                evict = []
+                for old_key, size in db.execute("SELECT key, size FROM entries ORDER BY accessed"):
+                    if total <= self.max_bytes:
+                        break
+                    if old_key != key:
+                        evict.append((old_key,))
+                        total -= size
+                db.executemany("DELETE FROM entries WHERE key = ?", evict)
+
+    def __contains__(self, key):
+        db = self._connect()
+        return db.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone() is not None
@@ -0,0 +1,124 @@
+import argparse
+import numpy as np
+from ase.data import atomic_numbers
+from sqs2atom import read_bestsqs, bestsqs_to_atoms, write_poscar
+from atom2sro import SiteNeighbors, SwapSRO, sro_pairs, sro_table, sro_table_to_dict
+
+
+class SROAnnealer:
+    """
+    Simulated annealing of site swaps that drives the per-shell SROs of a
+    SwapSRO state toward target values. The objective is the shell-weighted sum
+    of (alpha - target)^2 over the unique species pairs.
+    """
+    def __init__(self, state, shell_weights, targets=None, seed=None) -> None:
+        self.state = state
+        n_shell = state.neighbors.n_shell
+        if len(shell_weights) != n_shell:
+            raise ValueError(f"Got {len(shell_weights)} shell weights for {n_shell} shells")
+        if len(np.unique(state.types)) < 2:
+            # no swap would change the structure
+            raise ValueError("Annealing needs at least two species in the cell")
+        self.shell_weights = np.asarray(shell_weights, dtype=float)
+        n = state.n_species
+        self.targets = np.zeros((n_shell, n, n)) if targets is None else np.asarray(targets, dtype=float)
+        # every unordered pair once
+        self._upper = np.triu(np.ones((n, n), dtype=bool))
+        self.rng = np.random.default_rng(seed)
+
+    def objective(self, counts=None):
+        diff = (self.state.alphas(counts) - self.targets)[:, self._upper]
+        return float(np.sum(self.shell_weights * np.sum(diff * diff, axis=1)))
+
+    def random_swap(self):
+        """Two sites holding different species."""
+        types = self.state.types
+        while True:
+            p, q = self.rng.integers(0, len(types), 2)
+            if types[p] != types[q]:
+                return p, q
+
+    def run(self, steps, t_start=1e-2, t_end=1e-5):
+        """
+        Runs steps Metropolis swaps with a geometric temperature schedule and
+        leaves the state at the best configuration found. Returns its objective.
+        """
+        current = self.objective()
+        best, best_types = current, self.state.types.copy()
+        temperatures = np.geomspace(t_start, t_end, steps)
+        for temperature in temperatures:
+            p, q = self.random_swap()
+            delta = self.state.swap_delta(p, q)
+            trial = self.objective(self.state.counts + delta)
+            if trial <= current or self.rng.random() < np.exp((current - trial) / temperature):
+                self.state.swap(p, q, delta)
+                current = trial
+                if current < best:
+                    best, best_types = current, self.state.types.copy()
+        self.state = SwapSRO(self.state.neighbors, best_types, self.state.n_species, self.state.cumulative)
+        return best
+
+
+def targets_from_dict(species, n_shell, targets):
+    """
+    Builds the (n_shell, n_species, n_species) target array from a dict such as
+    {"TiCr": [-0.1, 0.05]} of per-shell targets (either species order); missing
+    pairs default to 0.
+    """
+    index = {x: n for n, x in enumerate(species)}
+    array = np.zeros((n_shell, len(species), len(species)))
+    pairs = sro_pairs(species)
+    unknown = set(targets) - {f"{A}{B}" for A, B in pairs} - {f"{B}{A}" for A, B in pairs}
+    if unknown:
+        raise ValueError(f"Targets for pairs not in the structure: {sorted(unknown)}")
+    for A, B in pairs:
+        values = targets.get(f"{A}{B}", targets.get(f"{B}{A}", [0.0] * n_shell))
+        if len(values) != n_shell:
+            raise ValueError(f"{A}{B} has {len(values)} targets for {n_shell} shells")
+        array[:, index[A], index[B]] = values
+        array[:, index[B], index[A]] = values
+    return array
+
+
+def optimize_bestsqs(file, scale, cutoffs, weights, steps, targets=None, seed=None):
+    """
+    Starts from a bestsqs.out file and anneals its species assignment.
+    Returns the optimized Atoms and its SRO dict as written to results.json.
+    """
+    basis_vectors, lattice_vectors, atomic_positions, atomic_species = read_bestsqs(file)
+    order = np.argsort(cutoffs)
+    cutoffs = [cutoffs[k] for k in order]
+    weights = [weights[k] for k in order]
+    atoms = bestsqs_to_atoms(lattice_vectors, atomic_positions, atomic_species, scale, sort=False)
+    neighbors = SiteNeighbors(atoms, cutoffs)
+
+    species = sorted(set(atomic_species), key=lambda x: atomic_numbers[x])
+    codes = {x: n for n, x in enumerate(species)}
+    state = SwapSRO(neighbors, [codes[x] for x in atomic_species], len(species))
+    annealer = SROAnnealer(state, weights, targets_from_dict(species, len(cutoffs), targets or {}), seed)
+    annealer.run(steps)
+
+    state = annealer.state
+    # sorted by atomic number so the POSCAR has one block per species, as for sqs2atoms
+    atoms = bestsqs_to_atoms(neighbors.cell, neighbors.positions, [species[t] for t in state.types])
+    return atoms, sro_table_to_dict(species, sro_table(state.alphas(), weights))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Anneal a bestsqs.out structure toward target SROs")
+    parser.add_argument("file", help="bestsqs.out file to start from")
+    parser.add_argument("--scale", type=float, default=3.13275, help="lattice constant")
+    parser.add_argument("--cutoffs", type=float, nargs="+", default=[2.9229, 3.7816])
+    parser.add_argument("--weights", type=float, nargs="+", default=[8, 6])
+    parser.add_argument("--steps", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--targets", nargs="+", action="append", default=[], metavar=("PAIR", "VALUE"),
+                        help="per-shell target SROs of a pair, e.g. --targets TiCr -0.1 0.05 (repeatable, default 0)")
+    args = parser.parse_args()
+
+    targets = {pair: [float(value) for value in values] for pair, *values in args.targets}
+    atoms, sro_data = optimize_bestsqs(args.file, args.scale, args.cutoffs, args.weights, args.steps,
+                                       targets=targets, seed=args.seed)
+    write_poscar(f"{args.file}.optimized", atoms)
+    for key, value in sro_data.items():
+        print(key, *value)
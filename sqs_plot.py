@@ -1,16 +1,84 @@
 import json
 import pandas as pd
 import dash
-from dash import dcc, html, dash_table
+from dash import dcc, html, dash_table, ctx
 from dash.dependencies import Input, Output, State
 import plotly.graph_objects as go
-import plotly.express as px
 import base64
 import io
+import os
+import argparse
+import hashlib
+from collections import OrderedDict
 import  numpy as np
+from sro_data import SRODataset, SROEnsemble, iter_ndjson
+from sqs_cache import DiskStore
+from dash.exceptions import PreventUpdate, MissingCallbackContextException
+
+# results.json followed with --watch, re-read whenever its mtime changes
+WATCH_FILE = None
+_watch_cache = {'mtime': None, 'ds': None}
+
+
+class DatasetStore:
+    """
+    Bounded LRU of parsed datasets keyed by the hash of the uploaded contents, so
+    the callbacks only exchange a short key with the browser and never re-parse.
+    With a sqs_cache.DiskStore behind it, entries are shared with the other
+    worker processes and loaded from disk when missing here.
+    """
+    def __init__(self, maxsize=8, disk=None):
+        self.maxsize = maxsize
+        self.disk = disk
+        self._data = OrderedDict()
+
+    def get(self, key):
+        if key not in self._data:
+            value = self.disk.get(key) if self.disk is not None else None
+            if value is not None:
+                self._remember(key, value)
+            return value
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    def _remember(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._data or (self.disk is not None and key in self.disk)
+
+
+# Parsed uploads and built figures, shared by all worker processes through an SQLite
+# file in the per-user cache directory (path in SQS_PLOT_CACHE, size limit in MB in
+# SQS_PLOT_CACHE_MB); the file is only created on first use
+cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+disk_store = DiskStore(
+    os.environ.get('SQS_PLOT_CACHE') or os.path.join(cache_home, 'sqs_plot', 'cache.sqlite'),
+    int(os.environ.get('SQS_PLOT_CACHE_MB', 1024)) << 20
+)
+datasets = DatasetStore(maxsize=64, disk=disk_store)
+figures = DatasetStore(maxsize=32, disk=disk_store)
+# Stacks of several uploaded runs for the ensemble statistics
+ensembles = DatasetStore(maxsize=4)
+
+# Points per trace of the interaction plot: about two per horizontal pixel
+MAX_POINTS = 2000
+# Markers are only drawn on traces up to this many points
+MARKER_POINTS = 500
 
 app = dash.Dash(__name__)
 
+# Polls the watched results file for new snapshots (enabled with --watch)
+watch_interval = dcc.Interval(id='watch-interval', interval=10000, disabled=True)
+
 # Layout with dynamically populated checklist and upload functionality
 app.layout = html.Div([
     html.H1('SRO Dashboard'),
@@ -20,7 +88,7 @@ app.layout = html.Div([
         id='upload-data',
         children=html.Div([
             'Drag and Drop or ',
-            html.A('Select a JSON File')
+            html.A('Select JSON or NPZ Files')
         ]),
         style={
             'width': '100%',
@@ -32,7 +100,15 @@ app.layout = html.Div([
             'textAlign': 'center',
             'margin': '10px'
         },
-        multiple=False
+        # several runs of the same composition can be uploaded together
+        multiple=True
+    ),
+
+    # Run shown in the single-run plots below
+    dcc.Dropdown(
+        id='run-dropdown',
+        options=[],
+        clearable=False
     ),
     
     # Dynamically populated interaction checklist
@@ -68,6 +144,11 @@ app.layout = html.Div([
 
     # Line plot for interactions vs. sqs_id
     dcc.Graph(id='interaction-sros-plot'),
+    watch_interval,
+    # Number of snapshots currently drawn in the interaction plot
+    dcc.Store(id='watch-state'),
+    # Key of the current dataset in the server-side store
+    dcc.Store(id='dataset-key'),
     # Dropdown to select sqs_id
     dcc.Dropdown(
         id='sqs-id-dropdown',
@@ -140,7 +221,35 @@ app.layout = html.Div([
     )
 ], style={'margin-left': '40px'})
 
-])
+]),
+
+    # Distribution of the per-atom SROs of the selected SQS (results analyzed with local SROs)
+    dcc.Graph(id='local-sro-plot'),
+
+    # Statistics over all uploaded runs
+    html.H2('Ensemble of Runs'),
+    dcc.Graph(id='ensemble-plot'),
+    html.Div([
+        html.Label("Shell weights for the ranking : "),
+        dcc.Input(
+            id='rank-weights',
+            type='text',
+            placeholder='equal, e.g. 8 6',
+            debounce=True
+        )
+    ], style={'margin': '10px'}),
+    dash_table.DataTable(
+        id='ranking-table',
+        columns=[
+            {'name': 'Run', 'id': 'Run'},
+            {'name': 'SQS ID', 'id': 'SQS ID'},
+            {'name': 'Name', 'id': 'Name'},
+            {'name': 'Weighted |SRO|', 'id': 'Score'}
+        ],
+        data=[],
+        style_cell={'textAlign': 'center', 'fontSize': '16px', 'padding': '6px'},
+        style_header={'fontWeight': 'bold', 'textAlign': 'center'}
+    )
  
 ])
 
@@ -149,66 +258,203 @@ def parse_contents(contents):
     content_type, content_string = contents.split(',')
 
     decoded = base64.b64decode(content_string)
+    return parse_results(decoded)
+
+def parse_results(decoded):
     try:
+        if decoded[:2] == b'PK':
+            # binary results.npz (a zip archive)
+            ds = SRODataset.from_npz(io.BytesIO(decoded))
+            ds.sros = np.round(ds.sros.astype(float), 3)
+            return ds
+        text = decoded.decode('utf-8')
+        if text.lstrip()[:1] == '{':
+            # streamed results (.ndjson or a .part file still being written)
+            return SRODataset.from_records(iter_ndjson(io.StringIO(text)))
         # Assuming the user uploads a JSON file
-        data = json.load(io.StringIO(decoded.decode('utf-8')))
-        df=pd.DataFrame(data).sort_values(by='time') #sort_values(by='sqs_id')
-        # Subtract the first entry from all others and calculate hours passed
-        df['time_difference_hours'] = ((df['time'] - df['time'].iloc[0]) / 3600).round(3)        
-        return df
+        data = json.load(io.StringIO(text))
+        # normalized once into dense arrays, sorted by time
+        return SRODataset.from_records(data)
     except Exception as e:
         print(e)
         return None
 
+def read_results(path):
+    """Loads a results file from disk into the same dataset as parse_contents."""
+    with open(path, 'rb') as f:
+        return parse_results(f.read())
+
+def load_watched():
+    """
+    Returns the watched results file, re-read only when its mtime changes. Until
+    the analysis has finalized it, the part file it is streamed to is read.
+    """
+    for path in (WATCH_FILE, f"{WATCH_FILE}.part"):
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            continue
+        if (path, mtime) != _watch_cache['mtime']:
+            _watch_cache['ds'] = read_results(path)
+            _watch_cache['mtime'] = (path, mtime)
+        return _watch_cache['ds']
+    return None
+
+def shell_labels(n_shells):
+    """Dropdown labels of the shell axis: '1st shell', '2nd shell', ..., 'Average'."""
+    ordinals = {1: 'st', 2: 'nd', 3: 'rd'}
+    return [f"{n}{ordinals.get(n, 'th')} shell" for n in range(1, n_shells)] + ['Average']
+
+def triggered_by(component_id):
+    """Whether the running callback was fired by component_id (False when called directly)."""
+    try:
+        return ctx.triggered_id == component_id
+    except MissingCallbackContextException:
+        return False
+
+def zoomed_range(relayout):
+    """
+    The time range zoomed to in a relayoutData event, None when the time axis
+    is (auto)reset, or False when the event leaves the time axis alone.
+    """
+    if not relayout or relayout.get('xaxis.autorange'):
+        return None
+    if 'xaxis.range[0]' in relayout:
+        return float(relayout['xaxis.range[0]']), float(relayout['xaxis.range[1]'])
+    if 'xaxis.range' in relayout:
+        return tuple(float(v) for v in relayout['xaxis.range'])
+    return False
+
+def downsample_minmax(x, y, n_buckets):
+    """
+    Indices of a shape-preserving subset of a series with sorted x: the first and
+    last points and the minimum and maximum of y in each of n_buckets equal-width
+    x buckets. Missing values (NaN) are dropped.
+    """
+    valid = np.flatnonzero(~np.isnan(y))
+    if len(valid) <= 2 * n_buckets:
+        return valid
+    xv = x[valid]
+    edges = np.linspace(xv[0], xv[-1], n_buckets + 1)
+    bucket = np.searchsorted(edges[1:-1], xv, side='right')
+    # sorted by bucket, then by y: the first and last entry of each bucket are its min and max
+    order = np.lexsort((y[valid], bucket))
+    first = np.flatnonzero(np.diff(bucket[order], prepend=-1))
+    last = np.append(first[1:] - 1, len(order) - 1)
+    keep = np.concatenate([order[first], order[last], [0, len(valid) - 1]])
+    return valid[np.unique(keep)]
+
+def get_dataset(key):
+    """Looks up the parsed dataset for a key produced by store_upload."""
+    if key is None:
+        return None
+    if key == 'watch':
+        return load_watched() if WATCH_FILE is not None else None
+    return datasets.get(key)
+
+def cached_figure(name, key, params, build):
+    """
+    Returns the figure built by build() for these parameters, from the figure store
+    shared with the other workers when it was built before. Figures of the watched
+    file change with it and are always rebuilt.
+    """
+    if key is None or 'watch' in key.split('|'):
+        return build()
+    figure_key = 'figure:' + hashlib.sha256(json.dumps([name, key, params]).encode()).hexdigest()
+    figure = figures.get(figure_key)
+    if figure is None:
+        figure = build()
+        figures.put(figure_key, figure)
+    return figure
+
+# Parse each uploaded run once and hand only the keys to the other callbacks
+@app.callback(
+    [Output('run-dropdown', 'options'),
+     Output('run-dropdown', 'value')],
+    [Input('upload-data', 'contents'),
+     State('upload-data', 'filename')]
+)
+def store_upload(contents, filenames):
+    if contents is None:
+        # fall back to the watched results file, if any
+        if WATCH_FILE is not None:
+            return [{'label': os.path.basename(WATCH_FILE), 'value': 'watch'}], 'watch'
+        return [], None
+    if isinstance(contents, str):
+        contents, filenames = [contents], [filenames]
+    options = []
+    for content, filename in zip(contents, filenames or [None] * len(contents)):
+        key = hashlib.sha256(content.encode()).hexdigest()
+        if key not in datasets:
+            ds = parse_contents(content)
+            if ds is None:
+                continue
+            datasets.put(key, ds)
+        options.append({'label': filename or key[:8], 'value': key})
+    return options, options[0]['value'] if options else None
+
+# The selected run becomes the dataset of the single-run plots, without a server round trip
+app.clientside_callback(
+    """
+    function(key) {
+        return key;
+    }
+    """,
+    Output('dataset-key', 'data'),
+    [Input('run-dropdown', 'value')]
+)
+
 # Callback to update the interaction checklist and dropdown options based on uploaded data
 @app.callback(
     [Output('interaction-checklist', 'options'),
      Output('interaction-checklist', 'value'),
      Output('sqs-id-dropdown', 'options'),
-     Output('sqs-id-dropdown', 'value')],
-    [Input('upload-data', 'contents')]
+     Output('sqs-id-dropdown', 'value'),
+     Output('shell-dropdown', 'options'),
+     Output('shell-dropdown', 'value')],
+    [Input('dataset-key', 'data'),
+     State('shell-dropdown', 'value')]
 )
-def update_controls(contents):
-    if contents is not None:
-        df = parse_contents(contents)
-        if df is not None:
-            # Extract interaction keys from the first entry's 'sros'
-            first_entry_sros = df.iloc[0]['sros']
-            interaction_options = [{'label': k, 'value': k} for k in first_entry_sros.keys()]
-            
-            # Default values for the checklist (select all interactions by default)
-            default_interaction = list(first_entry_sros.keys())
-            
-            # Create dropdown options for sqs_id
-            sqs_options = [{'label': f"SQS ID: {row['sqs_id']}", 'value': row['sqs_id']} for _, row in df.iterrows()]
-            
-            return interaction_options, default_interaction, sqs_options, df.iloc[0]['sqs_id']
-    
-    return [], [], [], None
+def update_controls(key, shell=0):
+    ds = get_dataset(key)
+    if ds is not None and len(ds):
+        interaction_options = [{'label': k, 'value': k} for k in ds.pairs]
+        
+        # Default values for the checklist (select all interactions by default)
+        default_interaction = list(ds.pairs)
+        
+        # Create dropdown options for sqs_id
+        sqs_options = [{'label': f"SQS ID: {sqs_id}", 'value': sqs_id} for sqs_id in ds.sqs_id.tolist()]
+        
+        # One entry per shell in the data, the last one being the weighted average
+        shell_options = [{'label': label, 'value': n} for n, label in enumerate(shell_labels(ds.n_shells))]
+        # keep the chosen shell if the new data has it
+        shell = min(shell or 0, ds.n_shells - 1)
+
+        return interaction_options, default_interaction, sqs_options, int(ds.sqs_id[0]), shell_options, shell
+
+    return [], [], [], None, dash.no_update, dash.no_update
 
 @app.callback(
     [Output('spider-plot', 'figure'),
      Output('data-table', 'data')],
     [Input('sqs-id-dropdown', 'value'),
-    Input('r1-input', 'value'),
-    Input('r2-input', 'value'),
-    State('upload-data', 'contents')]
+    State('r1-input', 'value'),
+    State('r2-input', 'value'),
+    State('dataset-key', 'data')]
 )
-def update_spider_chart_and_table(sqs_id,r1,r2, contents):
-    if contents is not None and sqs_id is not None:
-        df = parse_contents(contents)
-        if df is not None:
-            # Find the entry corresponding to the selected sqs_id
-            entry = next(item for item in df.to_dict('records') if item['sqs_id'] == sqs_id)
-    
-            # Extract SROs for plotting
-            sros_data = entry['sros']
-
-            # Create a DataFrame for both 1st shell and 2nd shell values
-            sros_df = pd.DataFrame(list(sros_data.items()), columns=['Pair', 'SRO Values'])
-            sros_df['1st Shell'] = sros_df['SRO Values'].apply(lambda x: x[0])
-            sros_df['2nd Shell'] = sros_df['SRO Values'].apply(lambda x: x[1])
-            sros_df['Average'] = sros_df['SRO Values'].apply(lambda x: x[2])
+def update_spider_chart_and_table(sqs_id,r1,r2, key):
+    if sqs_id is not None:
+        ds = get_dataset(key)
+        if ds is not None and int(sqs_id) in ds.row_index:
+            # (n_pairs, n_shells) values of the selected sqs_id, the last shell being the average
+            values = ds.snapshot(sqs_id)
+            sros_df = pd.DataFrame({
+                'Pair': ds.pairs,
+                '1st Shell': values[:, 0],
+                '2nd Shell': values[:, 1],
+                'Average': values[:, -1],
+            })
 
             # Categories for radar plot
             categories = sros_df['Pair'].tolist()  
@@ -278,69 +524,352 @@ def update_spider_chart_and_table(sqs_id,r1,r2, contents):
             return fig, table_data
     return {}, []
 
+# R1/R2 only change the radial axis range, so they are applied in the browser
+# to the figure already there instead of rebuilding it on the server
+app.clientside_callback(
+    """
+    function(r1, r2, figure) {
+        if (!figure || !figure.layout || !figure.layout.polar) {
+            return window.dash_clientside.no_update;
+        }
+        const polar = Object.assign({}, figure.layout.polar);
+        polar.radialaxis = Object.assign({}, polar.radialaxis, {range: [r1, r2]});
+        return Object.assign({}, figure, {layout: Object.assign({}, figure.layout, {polar: polar})});
+    }
+    """,
+    Output('spider-plot', 'figure', allow_duplicate=True),
+    [Input('r1-input', 'value'),
+     Input('r2-input', 'value'),
+     State('spider-plot', 'figure')],
+    prevent_initial_call=True
+)
+
+# Callback to show the per-atom SRO distributions of the selected sqs_id
+@app.callback(
+    Output('local-sro-plot', 'figure'),
+    [Input('sqs-id-dropdown', 'value'),
+     Input('interaction-checklist', 'value'),
+     Input('shell-dropdown', 'value'),
+     State('dataset-key', 'data')]
+)
+def update_local_sro_plot(sqs_id, selected_interactions, selected_shell, key):
+    ds = get_dataset(key)
+    if ds is None or ds.local_hist is None or sqs_id is None or int(sqs_id) not in ds.row_index:
+        return {}
+    # the weighted average has no per-atom counterpart, show the 1st shell instead
+    n_local_shells = ds.local_hist.shape[2]
+    shell = selected_shell if selected_shell < n_local_shells else 0
+    shell_label = shell_labels(ds.n_shells)[shell]
+
+    fig = go.Figure()
+    for interaction in selected_interactions:
+        edges, counts = ds.local_histogram(sqs_id, interaction, shell)
+        fig.add_trace(go.Bar(
+            x=(edges[:-1] + edges[1:]) / 2,
+            y=counts,
+            width=np.diff(edges),
+            opacity=0.6,
+            name=interaction
+        ))
+    fig.update_layout(
+        barmode='overlay',
+        title=f'Per-atom SRO distribution for SQS ID {sqs_id} ({shell_label})',
+        xaxis_title='Local SRO',
+        yaxis_title='Number of atoms'
+    )
+    return fig
+
 # Callback to update the interaction plot based on checklist and shell selection
 @app.callback(
-    Output('interaction-sros-plot', 'figure'),
+    [Output('interaction-sros-plot', 'figure'),
+     Output('watch-state', 'data')],
     [Input('interaction-checklist', 'value'),
      Input('shell-dropdown', 'value'),
-     Input('r-slider', 'value'),
-     State('upload-data', 'contents')]
+     State('r-slider', 'value'),
+     Input('interaction-sros-plot', 'relayoutData'),
+     State('dataset-key', 'data'),
+     State('watch-state', 'data')]
 )
-def update_interaction_plot(selected_interactions, selected_shell,r_value, contents):
-    shell_labels = {0: '1st shell', 1: '2nd shell', 2: 'Average 1st-2nd NN shell'}
-    shell_label = shell_labels.get(selected_shell, 'Unknown')  # Retrieve the label
-
-    if contents is not None:
-        df = parse_contents(contents)
-        print(df['time_difference_hours'])
-        if df is not None:
-            # Prepare a DataFrame for plotting interactions vs. sqs_id with timestamp
-            plot_data = []
-            for interaction in selected_interactions:
-                shell_values = [item['sros'][interaction][selected_shell] for item in df.to_dict('records')]
-                sqs_ids = [item['sqs_id'] for item in df.to_dict('records')]
-                timestamps = [item['time_difference_hours'] for item in df.to_dict('records')]  # Add timestamps for each record
-                
-                plot_df = pd.DataFrame({
-                    'sqs_id': sqs_ids,
-                    'SRO Values': shell_values,
-                    'Interaction': interaction,
-                    'Timestamp (Hour)': timestamps  # Include timestamps in the DataFrame
-                })
-                
-                plot_data.append(plot_df)
-    
-            # Combine the data into one DataFrame
-            combined_plot_df = pd.concat(plot_data).sort_values(by='Timestamp (Hour)')
-    
-            # Create the line plot with markers and include timestamp in hover data
-            fig = px.line(
-                combined_plot_df, 
-                # x='sqs_id', 
-                x='Timestamp (Hour)',
-                y='SRO Values', 
-                color='Interaction', 
-                hover_data={'sqs_id': True},  # Add timestamp to the hover data
-                title=f'SRO Values for Selected Interactions ({shell_label})', 
-                markers=True
-            )
+def update_interaction_plot(selected_interactions, selected_shell,r_value, relayout, key, state=None):
+    ds = get_dataset(key)
+    if ds is not None and selected_interactions:
+        if triggered_by('interaction-sros-plot'):
+            view = zoomed_range(relayout)
+            if view is False:
+                # a relayout that did not change the time axis (y zoom, resize, ...)
+                raise PreventUpdate
+        elif state and state.get('key') == key and state.get('view'):
+            # keep the zoom of the shown figure; relayoutData may belong to another dataset
+            view = tuple(state['view'])
+        else:
+            view = None
+        build = lambda: interaction_figure(ds, key, selected_interactions, selected_shell, r_value, view)
+        # a zoom range is hardly ever requested twice, so only the full view is stored
+        if view is None:
+            fig = cached_figure('interaction', key, [selected_interactions, selected_shell, r_value], build)
+        else:
+            fig = build()
+        return fig, {'key': key, 'n': len(ds), 'view': view}
+    return {}, None
 
-            # Add a shaded region between y=-0.01 and y=0.01
-            fig.add_shape(
-                type="rect",
-                xref="paper",  # Apply the shape across the entire x-axis range
-                x0=0, x1=1,  # This covers the full range of the x-axis (timestamps)
-                yref="y",  # Use 'y' axis for the vertical positioning
-                y0=-r_value, y1=r_value,  # Set the bounds for the shaded region
-                fillcolor="grey",  # You can choose a color here
-                opacity=0.3,  # Set the transparency of the shaded region
-                layer="above",  # Ensure the shaded region is drawn below the plot lines
-                line_width=0  # No border around the shaded region
-            )
+def interaction_figure(ds, key, selected_interactions, selected_shell, r_value, view):
+    """Time series of the selected interactions in one shell, limited to the zoomed time range view."""
+    shell_label = shell_labels(ds.n_shells)[selected_shell]
+
+    # Rows in the visible time range, plus one on each side so the lines leave the plot
+    x = ds.time_hours
+    rows = slice(None)
+    if view:
+        lo, hi = np.searchsorted(x, view)
+        rows = slice(max(lo - 1, 0), hi + 1)
+    x = x[rows]
+    values = ds.series(selected_interactions, selected_shell)[rows]
+    sqs_ids = ds.sqs_id[rows]
+
+    # WebGL traces of at most MAX_POINTS points each, one per interaction in
+    # checklist order so new points can be appended by index
+    fig = go.Figure()
+    for n, interaction in enumerate(selected_interactions):
+        keep = downsample_minmax(x, values[:, n], MAX_POINTS // 2)
+        fig.add_trace(go.Scattergl(
+            x=x[keep],
+            y=values[keep, n],
+            customdata=sqs_ids[keep, np.newaxis],
+            mode='lines+markers' if len(keep) <= MARKER_POINTS else 'lines',
+            name=interaction,
+            legendgroup=interaction,
+            hovertemplate='Interaction=' + interaction + '<br>Timestamp (Hour)=%{x}<br>SRO Values=%{y}<br>sqs_id=%{customdata[0]}<extra></extra>'
+        ))
+    fig.update_layout(
+        title=f'SRO Values for Selected Interactions ({shell_label})',
+        xaxis_title='Timestamp (Hour)',
+        yaxis_title='SRO Values',
+        legend_title_text='Interaction',
+        # keep the user's zoom when the figure is rebuilt for the same dataset
+        uirevision=key
+    )
+
+    # Add a shaded region between y=-0.01 and y=0.01
+    fig.add_shape(
+        type="rect",
+        xref="paper",  # Apply the shape across the entire x-axis range
+        x0=0, x1=1,  # This covers the full range of the x-axis (timestamps)
+        yref="y",  # Use 'y' axis for the vertical positioning
+        y0=-r_value, y1=r_value,  # Set the bounds for the shaded region
+        fillcolor="grey",  # You can choose a color here
+        opacity=0.3,  # Set the transparency of the shaded region
+        layer="above",  # Ensure the shaded region is drawn below the plot lines
+        line_width=0  # No border around the shaded region
+    )
+    # plain dicts are cheap to store and load, unlike Figure objects
+    return fig.to_dict()
+
+# The r slider only moves the shaded band, which is updated in the browser
+app.clientside_callback(
+    """
+    function(r, figure) {
+        if (!figure || !figure.layout || !figure.layout.shapes || !figure.layout.shapes.length) {
+            return window.dash_clientside.no_update;
+        }
+        const shapes = figure.layout.shapes.slice();
+        shapes[0] = Object.assign({}, shapes[0], {y0: -r, y1: r});
+        return Object.assign({}, figure, {layout: Object.assign({}, figure.layout, {shapes: shapes})});
+    }
+    """,
+    Output('interaction-sros-plot', 'figure', allow_duplicate=True),
+    [Input('r-slider', 'value'),
+     State('interaction-sros-plot', 'figure')],
+    prevent_initial_call=True
+)
+
+def get_ensemble(keys, labels):
+    """Stacks the datasets of the uploaded runs, reusing the stack of the same uploads."""
+    if 'watch' in keys:
+        # the watched file changes, so its stack is not kept
+        return SROEnsemble([get_dataset(key) for key in keys], labels)
+    key = '|'.join(keys)
+    ensemble = ensembles.get(key)
+    if ensemble is None:
+        ensemble = SROEnsemble([datasets.get(k) for k in keys], labels)
+        ensembles.put(key, ensemble)
+    return ensemble
+
+def parse_weights(text, n_shells):
+    """Shell weights typed as '8 6' (or '8, 6'); None (equal weights) if empty or invalid."""
+    try:
+        weights = [float(w) for w in (text or '').replace(',', ' ').split()]
+    except ValueError:
+        return None
+    return weights if len(weights) == n_shells and sum(weights) > 0 else None
+
+# Mean and bootstrap confidence interval of every run, over the band of all snapshots,
+# and the best snapshots of all runs
+@app.callback(
+    [Output('ensemble-plot', 'figure'),
+     Output('ranking-table', 'data')],
+    [Input('run-dropdown', 'options'),
+     Input('interaction-checklist', 'value'),
+     Input('shell-dropdown', 'value'),
+     Input('rank-weights', 'value')]
+)
+def update_ensemble(run_options, selected_interactions, selected_shell, weights_text):
+    runs = [option for option in run_options or [] if get_dataset(option['value']) is not None
+            and len(get_dataset(option['value']))]
+    if not runs:
+        return {}, []
+    return cached_figure('ensemble', '|'.join(run['value'] for run in runs),
+                         [[run['label'] for run in runs], selected_interactions, selected_shell, weights_text],
+                         lambda: ensemble_figure(runs, selected_interactions, selected_shell, weights_text))
+
+def ensemble_figure(runs, selected_interactions, selected_shell, weights_text):
+    """Ensemble plot and ranking table rows of the uploaded runs."""
+    try:
+        ensemble = get_ensemble([run['value'] for run in runs], [run['label'] for run in runs])
+    except ValueError as e:
+        print(e)
+        return {}, []
+
+    top, scores = ensemble.rank_snapshots(parse_weights(weights_text, ensemble.n_shells - 1))
+    ranking = [{'Run': ensemble.labels[ensemble.run[row]],
+                'SQS ID': int(ensemble.sqs_id[row]),
+                'Name': ensemble.names[row],
+                'Score': round(float(scores[row]), 4)} for row in top]
+
+    pairs = [pair for pair in selected_interactions or [] if pair in ensemble.pairs]
+    if not pairs or selected_shell >= ensemble.n_shells:
+        return {}, ranking
+    shell_label = shell_labels(ensemble.n_shells)[selected_shell]
+    stats = ensemble.stats(pairs, selected_shell)
+    lower, upper = ensemble.bootstrap_ci(pairs, selected_shell)
+
+    # band over all runs: mean +- std of the pooled snapshots, and their range
+    values, valid = ensemble.values(pairs, selected_shell)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        count = valid.sum(axis=0)
+        pooled_mean = np.where(valid, values, 0).sum(axis=0) / count
+        pooled_std = np.sqrt((np.where(valid, values - pooled_mean, 0) ** 2).sum(axis=0) / count)
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=pairs, y=np.fmin.reduce(values, axis=0), mode='lines',
+                             line=dict(color='grey', dash='dot'), name='All runs: min'))
+    fig.add_trace(go.Scatter(x=pairs, y=np.fmax.reduce(values, axis=0), mode='lines',
+                             line=dict(color='grey', dash='dot'), name='All runs: max'))
+    fig.add_trace(go.Scatter(x=pairs, y=pooled_mean - pooled_std, mode='lines', line=dict(width=0),
+                             showlegend=False, hoverinfo='skip'))
+    fig.add_trace(go.Scatter(x=pairs, y=pooled_mean + pooled_std, mode='lines', line=dict(width=0),
+                             fill='tonexty', fillcolor='rgba(128, 128, 128, 0.3)', name='All runs: mean ± std'))
+    for r, label in enumerate(ensemble.labels):
+        fig.add_trace(go.Scatter(
+            x=pairs,
+            y=stats['mean'][r],
+            error_y=dict(type='data', symmetric=False,
+                         array=upper[r] - stats['mean'][r], arrayminus=stats['mean'][r] - lower[r]),
+            customdata=np.stack([stats['std'][r], stats['min'][r], stats['max'][r]], axis=-1),
+            mode='markers',
+            name=label,
+            hovertemplate='%{x}: mean %{y:.3f}, std %{customdata[0]:.3f}, '
+                          'range [%{customdata[1]:.3f}, %{customdata[2]:.3f}]'
+        ))
+    fig.update_layout(
+        title=f'Mean SRO per run with 95% bootstrap intervals ({shell_label})',
+        xaxis_title='Interaction',
+        yaxis_title='SRO Values',
+        scattermode='group'
+    )
+    return fig.to_dict(), ranking
+
+# In --watch mode, append the snapshots written since the last poll to the interaction plot
+@app.callback(
+    [Output('interaction-sros-plot', 'extendData'),
+     Output('sqs-id-dropdown', 'options', allow_duplicate=True),
+     Output('watch-state', 'data', allow_duplicate=True),
+     Output('interaction-checklist', 'options', allow_duplicate=True),
+     Output('interaction-checklist', 'value', allow_duplicate=True),
+     Output('sqs-id-dropdown', 'value', allow_duplicate=True),
+     Output('shell-dropdown', 'options', allow_duplicate=True),
+     Output('shell-dropdown', 'value', allow_duplicate=True)],
+    [Input('watch-interval', 'n_intervals'),
+     State('watch-state', 'data'),
+     State('interaction-checklist', 'value'),
+     State('shell-dropdown', 'value'),
+     State('dataset-key', 'data'),
+     State('interaction-checklist', 'options')],
+    prevent_initial_call=True
+)
+def stream_new_points(n_intervals, state, selected_interactions, selected_shell, key, interaction_options=None):
+    # an uploaded file takes precedence over the watched one
+    if key != 'watch':
+        raise PreventUpdate
+    ds = get_dataset(key)
+    if ds is None or not len(ds):
+        raise PreventUpdate
+    if not interaction_options:
+        # the page was loaded before the first results were written: fill in the
+        # controls now, which also draws the figure
+        options, interactions, sqs_options, sqs_id, shell_options, shell = update_controls(key, selected_shell)
+        return dash.no_update, sqs_options, dash.no_update, options, interactions, sqs_id, shell_options, shell
+    if state is None or not selected_interactions or len(ds) <= state['n']:
+        raise PreventUpdate
+
+    new_rows = slice(state['n'], None)
+    timestamps = ds.time_hours[new_rows].tolist()
+    sqs_ids = ds.sqs_id[new_rows, np.newaxis].tolist()
+    shell_values = ds.series(selected_interactions, selected_shell)[new_rows].T.tolist()
+    extend_data = {
+        'x': [timestamps] * len(selected_interactions),
+        'y': shell_values,
+        'customdata': [sqs_ids] * len(selected_interactions),
+    }
+    sqs_options = [{'label': f"SQS ID: {sqs_id}", 'value': sqs_id} for sqs_id in ds.sqs_id.tolist()]
+    return ([extend_data, list(range(len(selected_interactions)))], sqs_options, dict(state, n=len(ds)),
+            *[dash.no_update] * 5)
+
+def watch_results(path, interval=10.0):
+    """Follows a results file updated by analyze_sqs.py --watch."""
+    global WATCH_FILE
+    WATCH_FILE = path
+    watch_interval.disabled = False
+    watch_interval.interval = int(interval * 1000)
+
+# WSGI entry point for production servers, e.g. gunicorn -w 4 sqs_plot:server
+server = app.server
+if os.environ.get('SQS_PLOT_WATCH'):
+    watch_results(os.environ['SQS_PLOT_WATCH'], float(os.environ.get('SQS_PLOT_INTERVAL', 10.0)))
+
+def serve_workers(host, port, workers):
+    """Serves the dashboard from several gunicorn worker processes."""
+    from gunicorn.app.base import BaseApplication
+
+    class DashboardServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f"{host}:{port}")
+            self.cfg.set('workers', workers)
+
+        def load(self):
+            return server
+
+    DashboardServer().run()
 
-            return fig
-    return {}
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SRO dashboard")
+    parser.add_argument("--watch", metavar="RESULTS", help="follow a results.json updated by analyze_sqs.py --watch")
+    parser.add_argument("--interval", type=float, default=10.0, help="seconds between polls of the watched file")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (0.0.0.0 to share the dashboard)")
+    parser.add_argument("--port", type=int, default=8050)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="serve from this many processes (needs gunicorn); they share parsed uploads and figures")
+    parser.add_argument("--debug", action="store_true", help="single-process development server with reloading")
+    args = parser.parse_args(argv)
+    if args.watch:
+        watch_results(args.watch, args.interval)
 
+    if args.workers > 1 and not args.debug:
+        try:
+            import gunicorn
+        except ImportError:
+            parser.error("--workers needs gunicorn (pip install gunicorn)")
+        serve_workers(args.host, args.port, args.workers)
+    else:
+        app.run(host=args.host, port=args.port, debug=args.debug)
 
 if __name__ == '__main__':
-    app.run_server(debug=True)
+    main()
@@ -0,0 +1,392 @@
+import os
+import re
+import sys
+import json
+import zipfile
+import warnings
+import numpy as np
+
+
+class SRODataset:
+    """
+    Columnar view of the SRO results of one SQS run.
+
+    sros is a dense (n_snapshots, n_pairs, n_shells) float array where the last
+    shell is the weighted average, as in the lists of results.json. Snapshots are
+    sorted by time and described by the names, sqs_id, time and time_hours vectors.
+    If the results hold per-atom SRO histograms, local_hist is an
+    (n_snapshots, n_pairs, n_local_shells, n_bins) count array with the bin
+    edges of every snapshot in local_edges; both are None otherwise.
+    """
+    def __init__(self, pairs, sros, names, sqs_id, time, local_edges=None, local_hist=None) -> None:
+        time = np.asarray(time, dtype=float)
+        self.pairs = list(pairs)
+        self.sros = np.asarray(sros)
+        self.names = list(names)
+        self.sqs_id = np.asarray(sqs_id)
+        self.time = time
+        self.local_edges = local_edges
+        self.local_hist = local_hist
+        if np.any(np.diff(time) < 0):
+            order = np.argsort(time, kind='stable')
+            if local_hist is not None:
+                self.local_edges = np.asarray(local_edges)[order]
+                self.local_hist = np.asarray(local_hist)[order]
+            self.sros = self.sros[order]
+            self.names = [self.names[k] for k in order]
+            self.sqs_id = self.sqs_id[order]
+            self.time = time[order]
+        # hours passed since the first snapshot
+        self.time_hours = np.round((self.time - self.time[0]) / 3600, 3) if len(self.time) else self.time
+        self.pair_index = {pair: n for n, pair in enumerate(self.pairs)}
+        self.row_index = {int(k): n for n, k in enumerate(self.sqs_id)}
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Builds the dataset from the dicts written to results.json, in one pass over
+        any iterable of records (e.g. iter_ndjson of a streamed results file).
+        """
+        pairs = None
+        sros, names, sqs_ids, times, local_edges, local_hist = [], [], [], [], [], []
+        for record in records:
+            if pairs is None:
+                pairs = list(record['sros'])
+                missing = [np.nan] * (len(next(iter(record['sros'].values()))) if pairs else 0)
+            sros.append(np.array([record['sros'].get(pair, missing) for pair in pairs], dtype=float))
+            names.append(record['name'])
+            sqs_ids.append(record['sqs_id'])
+            times.append(record['time'])
+            if local_edges is not None and 'local_sros' in record:
+                local_edges.append(np.array(record['local_sros']['edges'], dtype=float))
+                local_hist.append(np.array([record['local_sros'][pair] for pair in pairs], dtype=np.int64))
+            else:
+                # only kept if every record has them
+                local_edges = local_hist = None
+        if pairs is None:
+            return cls([], np.empty((0, 0, 0)), [], [], [])
+        n_shells = len(missing)
+        sros = np.array(sros, dtype=float).reshape(len(names), len(pairs), n_shells)
+        if local_edges is not None:
+            local_edges, local_hist = np.array(local_edges), np.array(local_hist)
+        return cls(pairs, sros, names, sqs_ids, times, local_edges, local_hist)
+
+    @classmethod
+    def from_ndjson(cls, path):
+        """Loads a streamed results file (NDJSON), including one still being written."""
+        with open(path) as f:
+            return cls.from_records(iter_ndjson(f))
+
+    @classmethod
+    def from_npz(cls, file, mmap=False):
+        """
+        Loads a dataset written by save_npz from a path or file object. With
+        mmap=True the numeric columns of a file on disk are memory-mapped
+        instead of read, so only the slices that are used get loaded.
+        """
+        numeric = ['sros', 'sqs_id', 'time']
+        with np.load(file) as data:
+            columns = {name: data[name] for name in ('pairs', 'names')}
+            if 'local_hist' in data.files:
+                numeric += ['local_edges', 'local_hist']
+            if not mmap:
+                columns.update({name: data[name] for name in numeric})
+        if mmap:
+            columns.update({name: npz_memmap(file, name) for name in numeric})
+        return cls(columns['pairs'].tolist(), columns['sros'], columns['names'].tolist(),
+                   columns['sqs_id'], columns['time'], columns.get('local_edges'), columns.get('local_hist'))
+
+    def save_npz(self, path):
+        """
+        Writes the dataset as an uncompressed NPZ: species, pairs, pair_index
+        (species indices of each pair), a float32 (n_snapshots, n_pairs, n_shells)
+        sros array and the name, sqs_id and time columns, plus the local SRO
+        histograms when present.
+        """
+        species = pair_species(self.pairs)
+        index = {x: n for n, x in enumerate(species)}
+        pair_index = np.array([[index[x] for x in split_pair(pair)] for pair in self.pairs], dtype=np.int64).reshape(-1, 2)
+        local = {}
+        if self.local_hist is not None:
+            local = dict(local_edges=np.asarray(self.local_edges, dtype=np.float64),
+                         local_hist=np.asarray(self.local_hist, dtype=np.int64))
+        tmp = f"{path}.tmp"
+        with open(tmp, 'wb') as f:
+            np.savez(
+                f,
+                **local,
+                species=np.array(species, dtype=str),
+                pairs=np.array(self.pairs, dtype=str),
+                pair_index=pair_index,
+                sros=self.sros.astype(np.float32),
+                names=np.array(self.names, dtype=str),
+                sqs_id=self.sqs_id.astype(np.int64),
+                time=self.time.astype(np.float64),
+            )
+        os.replace(tmp, path)
+
+    def __len__(self):
+        return len(self.sqs_id)
+
+    @property
+    def n_shells(self):
+        return self.sros.shape[2]
+
+    def row(self, sqs_id):
+        return self.row_index[int(sqs_id)]
+
+    def series(self, pairs, shell):
+        """(n_snapshots, len(pairs)) values of the given pairs in one shell."""
+        return self.sros[:, [self.pair_index[pair] for pair in pairs], shell]
+
+    def local_histogram(self, sqs_id, pair, shell):
+        """(edges, counts) of the per-atom SROs of one pair and shell in one snapshot."""
+        row = self.row(sqs_id)
+        return self.local_edges[row], self.local_hist[row, self.pair_index[pair], shell]
+
+    def snapshot(self, sqs_id):
+        """(n_pairs, n_shells) values of one snapshot."""
+        return self.sros[self.row(sqs_id)]
+
+
+class SROEnsemble:
+    """
+    Several SRO datasets (independent mcsqs runs) stacked into one array.
+
+    sros is the (n_total, n_pairs, n_shells) concatenation of the runs on the union
+    of their pairs (NaN where a run lacks a pair); the snapshots of run r are the
+    rows offsets[r]:offsets[r + 1], so per-run reductions are single reduceat calls.
+    """
+    def __init__(self, datasets, labels=None) -> None:
+        self.labels = list(labels) if labels is not None else [f"run {n + 1}" for n in range(len(datasets))]
+        self.pairs = list(dict.fromkeys(pair for ds in datasets for pair in ds.pairs))
+        n_shells = {ds.n_shells for ds in datasets if len(ds)}
+        if len(n_shells) > 1:
+            raise ValueError(f"Runs have different numbers of shells: {sorted(n_shells)}")
+        self.n_shells = n_shells.pop() if n_shells else 0
+        sizes = [len(ds) for ds in datasets]
+        self.offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        self.sros = np.full((self.offsets[-1], len(self.pairs), self.n_shells), np.nan)
+        self.sqs_id = np.empty(self.offsets[-1], dtype=np.int64)
+        self.names = []
+        pair_index = {pair: n for n, pair in enumerate(self.pairs)}
+        for ds, start, stop in zip(datasets, self.offsets[:-1], self.offsets[1:]):
+            if stop > start:
+                self.sros[start:stop, [pair_index[pair] for pair in ds.pairs]] = ds.sros
+            self.sqs_id[start:stop] = ds.sqs_id
+            self.names += ds.names
+        self.run = np.repeat(np.arange(len(datasets)), sizes)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def values(self, pairs, shell):
+        """(n_total, len(pairs)) values of the given pairs in one shell, and their validity mask."""
+        values = self.sros[:, [self.pairs.index(pair) for pair in pairs], shell]
+        return values, ~np.isnan(values)
+
+    def stats(self, pairs, shell):
+        """
+        Per-run mean, std, min and max of the given pairs in one shell, each an
+        (n_runs, len(pairs)) array, ignoring missing values. Runs without
+        snapshots give NaN.
+        """
+        values, valid = self.values(pairs, shell)
+        stats = {name: np.full((len(self), len(pairs)), np.nan) for name in ("mean", "std", "min", "max")}
+        # reduceat needs strictly valid start indices, so only non-empty runs are reduced
+        filled = np.flatnonzero(np.diff(self.offsets))
+        if not len(filled):
+            return stats
+        starts = self.offsets[filled]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            count = np.add.reduceat(valid, starts, axis=0)
+            mean = np.add.reduceat(np.where(valid, values, 0.0), starts, axis=0) / count
+            row = np.repeat(np.arange(len(filled)), np.diff(self.offsets)[filled])
+            deviation = np.where(valid, values - mean[row], 0.0)
+            std = np.sqrt(np.add.reduceat(deviation * deviation, starts, axis=0) / count)
+        stats["mean"][filled] = mean
+        stats["std"][filled] = std
+        stats["min"][filled] = np.fmin.reduceat(values, starts, axis=0)
+        stats["max"][filled] = np.fmax.reduceat(values, starts, axis=0)
+        return stats
+
+    def bootstrap_ci(self, pairs, shell, n_boot=200, level=0.95, seed=0, max_draws=1 << 22):
+        """
+        Percentile bootstrap confidence interval of the per-run means, as two
+        (n_runs, len(pairs)) arrays (lower, upper). The resamples of all runs are
+        drawn at once as a (n_boot, n_total) multiplicity matrix, so the resampled
+        means are one matrix product per run; resamples are processed in chunks of
+        at most max_draws drawn snapshots.
+        """
+        values, valid = self.values(pairs, shell)
+        n_total = len(values)
+        zeroed = np.where(valid, values, 0.0)
+        valid = valid.astype(float)
+        sizes = np.diff(self.offsets)
+        rng = np.random.default_rng(seed)
+        means = np.full((n_boot, len(self), len(pairs)), np.nan)
+        chunk = max(1, max_draws // max(n_total, 1))
+        for start in range(0, n_boot, chunk):
+            n = min(chunk, n_boot - start)
+            # draw n_r snapshots with replacement inside every run r
+            draws = self.offsets[self.run] + (rng.random((n, n_total)) * sizes[self.run]).astype(np.int64)
+            codes = (np.arange(n)[:, np.newaxis] * n_total + draws).ravel()
+            weights = np.bincount(codes, minlength=n * n_total).reshape(n, n_total).astype(float)
+            for r, (a, b) in enumerate(zip(self.offsets[:-1], self.offsets[1:])):
+                if a == b:
+                    continue
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    means[start:start + n, r] = (weights[:, a:b] @ zeroed[a:b]) / (weights[:, a:b] @ valid[a:b])
+        tail = 50 * (1 - level)
+        with warnings.catch_warnings():
+            # pairs missing from a whole run have no interval
+            warnings.simplefilter("ignore", RuntimeWarning)
+            lower, upper = np.nanpercentile(means, [tail, 100 - tail], axis=0)
+        return lower, upper
+
+    def rank_snapshots(self, shell_weights=None, top=20):
+        """
+        Snapshots of all runs ranked by their weighted |alpha|: the mean over pairs
+        of sum_s w_s |alpha_s| / sum_s w_s over the per-shell columns (equal weights
+        by default). Returns the row indices of the top best (lowest) scores and
+        the scores of every snapshot.
+        """
+        n_shells = self.n_shells - 1
+        weights = np.ones(n_shells) if shell_weights is None else np.asarray(shell_weights, dtype=float)
+        if len(weights) != n_shells:
+            raise ValueError(f"Got {len(weights)} shell weights for {n_shells} shells")
+        with np.errstate(invalid="ignore"):
+            per_pair = np.abs(self.sros[:, :, :n_shells]) @ (weights / weights.sum())
+        with warnings.catch_warnings():
+            # snapshots without any pair are ranked last
+            warnings.simplefilter("ignore", RuntimeWarning)
+            scores = np.nanmean(per_pair, axis=1)
+        order = np.argsort(np.where(np.isnan(scores), np.inf, scores), kind='stable')
+        return order[:top], scores
+
+
+class ResultsWriter:
+    """
+    Streams result records to disk as they are produced, in constant memory.
+
+    Records are appended as JSON lines to "<path>.part", flushed after every record
+    and fsynced every sync_every records, so a crash loses at most the record being
+    written and the part file stays readable (see iter_ndjson). finalize() turns
+    it into path atomically: NDJSON for .ndjson/.jsonl, the columnar NPZ format
+    for .npz and an indented results.json list otherwise. Used as a context
+    manager, the output is only finalized if no exception occurred.
+    """
+    def __init__(self, path, sync_every=64) -> None:
+        self.path = str(path)
+        self.part = f"{self.path}.part"
+        self.sync_every = sync_every
+        self.n_records = 0
+        self._file = open(self.part, 'w')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.finalize()
+        else:
+            # keep what was written in the part file
+            self.close()
+
+    def write(self, record):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        self.n_records += 1
+        if self.n_records % self.sync_every == 0:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if not self._file.closed:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+    def discard(self):
+        """Closes and removes the part file without touching the output."""
+        self.close()
+        os.remove(self.part)
+
+    def finalize(self):
+        self.close()
+        if self.path.endswith((".ndjson", ".jsonl")):
+            os.replace(self.part, self.path)
+            return
+        if self.path.endswith(".npz"):
+            SRODataset.from_ndjson(self.part).save_npz(self.path)
+        else:
+            # the same bytes as json.dump(records, f, indent=4), one record at a time
+            tmp = f"{self.path}.tmp"
+            with open(self.part) as records, open(tmp, 'w') as f:
+                f.write("[")
+                for n, record in enumerate(iter_ndjson(records)):
+                    text = json.dumps(record, indent=4).replace("\n", "\n    ")
+                    f.write(("," if n else "") + "\n    " + text)
+                f.write("\n]" if self.n_records else "]")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        os.remove(self.part)
+
+
+def iter_ndjson(lines):
+    """
+    Records of an NDJSON file object or iterable of lines. An incomplete last line
+    (a record still being written) is skipped.
+    """
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            if line.endswith("\n"):
+                raise
+            return
+
+
+def split_pair(pair):
+    """Splits a pair key such as "TiCr" into its two element symbols."""
+    return re.findall(r"[A-Z][a-z]*", pair)
+
+
+def pair_species(pairs):
+    """Unique species of the pair keys, in order of first appearance."""
+    return list(dict.fromkeys(x for pair in pairs for x in split_pair(pair)))
+
+
+def npz_memmap(path, name):
+    """Memory-maps one array stored uncompressed inside an .npz file."""
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo(f"{name}.npy")
+        if info.compress_type != zipfile.ZIP_STORED:
+            raise ValueError(f"{name}.npy is compressed and cannot be memory-mapped")
+        with open(path, 'rb') as f:
+            # skip the local file header to reach the .npy payload
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = np.frombuffer(f.read(4), dtype='<u2')
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            offset = f.tell()
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape, offset=offset,
+                     order='F' if fortran_order else 'C')
+
+
+def json_to_npz(json_path, npz_path):
+    """Converts an existing results.json into the binary NPZ format."""
+    with open(json_path) as f:
+        SRODataset.from_records(json.load(f)).save_npz(npz_path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("usage: python sro_data.py results.json results.npz")
+    json_to_npz(sys.argv[1], sys.argv[2])
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+from ase.build import bulk
+from atom2sro import SRO, SiteNeighbors, SwapSRO, ensemble_sro_tables, species_codes, sro_table_to_dict
+
+# lattice, lattice constant, repeats, elements, cutoffs, shell weights
+CASES = {
+    "bcc_TiV": ("bcc", 3.2, 3, ["Ti", "V"], [2.99, 3.86], [8, 6]),
+    "bcc_TiVCrNbMo": ("bcc", 3.2, 3, ["Ti", "V", "Cr", "Nb", "Mo"], [2.99, 3.86], [8, 6]),
+    "fcc_CrCoNi": ("fcc", 3.6, 2, ["Cr", "Co", "Ni"], [3.07, 4.0], [12, 6]),
+    "fcc_CrFeCoNi": ("fcc", 3.6, 3, ["Cr", "Fe", "Co", "Ni"], [3.07, 4.0], [12, 6]),
+}
+
+# get_all_sro of the original per-cutoff implementation, key order included
+EXPECTED = {
+    ("bcc_TiV", "sorted"): {
+        "TiTi": [0.011, 0.073, 0.038], "TiV": [-0.016, -0.107, -0.055], "VV": [0.024, 0.155, 0.08],
+    },
+    ("bcc_TiV", "shuffled"): {
+        "TiTi": [0.011, 0.073, 0.038], "TiV": [-0.016, -0.107, -0.055], "VV": [0.024, 0.155, 0.08],
+    },
+    ("bcc_TiVCrNbMo", "sorted"): {
+        "TiTi": [0.331, 0.107, 0.235], "TiV": [0.219, 0.012, 0.13], "TiCr": [-0.395, -0.02, -0.234],
+        "TiNb": [-0.289, -0.052, -0.187], "TiMo": [0.107, -0.052, 0.039], "VV": [0.107, 0.044, 0.08],
+        "VCr": [0.163, -0.116, 0.043], "VNb": [-0.289, 0.018, -0.157], "VMo": [-0.227, 0.044, -0.111],
+        "CrCr": [0.665, 0.299, 0.508], "CrNb": [0.018, -0.087, -0.027], "CrMo": [-0.45, -0.084, -0.293],
+        "NbNb": [0.46, 0.151, 0.328], "NbMo": [0.141, -0.017, 0.073], "MoMo": [0.442, 0.107, 0.298],
+    },
+    ("bcc_TiVCrNbMo", "shuffled"): {
+        "TiTi": [0.331, 0.107, 0.235], "TiV": [0.219, 0.012, 0.13], "TiMo": [0.107, -0.052, 0.039],
+        "TiNb": [-0.289, -0.052, -0.187], "TiCr": [-0.395, -0.02, -0.234], "VV": [0.107, 0.044, 0.08],
+        "VMo": [-0.227, 0.044, -0.111], "VNb": [-0.289, 0.018, -0.157], "VCr": [0.163, -0.116, 0.043],
+        "MoMo": [0.442, 0.107, 0.298], "NbMo": [0.141, -0.017, 0.073], "CrMo": [-0.45, -0.084, -0.293],
+        "NbNb": [0.46, 0.151, 0.328], "CrNb": [0.018, -0.087, -0.027], "CrCr": [0.665, 0.299, 0.508],
+    },
+    ("fcc_CrCoNi", "sorted"): {
+        "CrCr": [0.053, 0.243, 0.116], "CrCo": [-0.01, -0.157, -0.059], "CrNi": [-0.094, -0.185, -0.124],
+        "CoCo": [0.022, 0.179, 0.074], "NiCo": [-0.026, -0.048, -0.033], "NiNi": [0.259, 0.506, 0.341],
+    },
+    ("fcc_CrCoNi", "shuffled"): {
+        "CrCr": [0.053, 0.243, 0.116], "CrCo": [-0.01, -0.157, -0.059], "CrNi": [-0.094, -0.185, -0.124],
+        "CoCo": [0.022, 0.179, 0.074], "NiCo": [-0.026, -0.048, -0.033], "NiNi": [0.259, 0.506, 0.341],
+    },
+    ("fcc_CrFeCoNi", "sorted"): {
+        "CrCr": [0.027, 0.124, 0.059], "CrFe": [-0.017, -0.096, -0.043], "CrCo": [0.011, -0.034, -0.004],
+        "CrNi": [-0.047, -0.116, -0.07], "FeFe": [0.02, 0.347, 0.129], "FeCo": [-0.032, -0.143, -0.069],
+        "FeNi": [0.045, 0.0, 0.03], "CoCo": [0.033, 0.355, 0.14], "NiCo": [-0.023, -0.153, -0.066],
+        "NiNi": [0.07, 0.38, 0.173],
+    },
+    ("fcc_CrFeCoNi", "shuffled"): {
+        "CrCr": [0.027, 0.124, 0.059], "CrCo": [0.011, -0.034, -0.004], "CrFe": [-0.017, -0.096, -0.043],
+        "CrNi": [-0.047, -0.116, -0.07], "CoCo": [0.033, 0.355, 0.14], "FeCo": [-0.032, -0.143, -0.069],
+        "NiCo": [-0.023, -0.153, -0.066], "FeFe": [0.02, 0.347, 0.129], "FeNi": [0.045, 0.0, 0.03],
+        "NiNi": [0.07, 0.38, 0.173],
+    },
+}
+
+
+def structure(name, order):
+    """A fixed, uneven species assignment, sorted by atomic number (as sqs2atoms) or with shuffled sites."""
+    lattice, a, repeats, elements = CASES[name][:4]
+    atoms = bulk("Fe", lattice, a=a, cubic=True).repeat(repeats)
+    n = len(atoms)
+    atoms.set_chemical_symbols([elements[(7 * k + k // 5) % len(elements)] for k in range(n)])
+    if order == "sorted":
+        return atoms[np.argsort(atoms.numbers, kind="stable")]
+    return atoms[(37 * np.arange(n)) % n]
+
+
+@pytest.mark.parametrize("name, order", list(EXPECTED))
+def test_get_all_sro_matches_reference(name, order):
+    cutoffs, weights = CASES[name][4:]
+    sros = SRO(structure(name, order), cutoffs, weights).get_all_sro()
+    assert list(sros.items()) == list(EXPECTED[name, order].items())
+
+
+@pytest.mark.parametrize("name", list(CASES))
+def test_ensemble_tables_match_sro(name):
+    cutoffs, weights = CASES[name][4:]
+    atoms = [structure(name, order) for order in ("sorted", "shuffled")]
+    # a second species assignment on the same sites: the shuffled symbols on the sorted positions
+    atoms[1].positions = atoms[0].positions
+    neighbors = SiteNeighbors(atoms[0], cutoffs)
+    species, _ = species_codes(list(atoms[0].symbols))
+    codes = {x: n for n, x in enumerate(species)}
+    types = np.array([[codes[x] for x in a.symbols] for a in atoms])
+    tables = ensemble_sro_tables(neighbors, types, len(species), weights)
+    for a, table in zip(atoms, tables):
+        assert sro_table_to_dict(species, table) == SRO(a, cutoffs, weights).get_all_sro()
+
+
+@pytest.mark.parametrize("name", list(CASES))
+def test_swaps_match_recount(name):
+    cutoffs, weights = CASES[name][4:]
+    atoms = structure(name, "shuffled")
+    neighbors = SiteNeighbors(atoms, cutoffs)
+    species, types = species_codes(list(atoms.symbols))
+    state = SwapSRO(neighbors, types, len(species))
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        p, q = rng.integers(0, len(atoms), 2)
+        state.swap(p, q)
+        np.testing.assert_array_equal(state.counts, neighbors.pair_counts(state.types, len(species)))
+    fresh = SwapSRO(neighbors, state.types, len(species))
+    np.testing.assert_allclose(state.alphas(), fresh.alphas())